@@ -33,7 +33,7 @@ __author__ = "Mathieu Fenniak"
 exec("from struct import Struct")
 for fmt in (
         "i", "h", "hhhh", "q", "d", "f", "iii", "ii", "qii", "dii", "ihihih",
-        "ci", "bh", "cccc"):
+        "ci", "bh", "cccc", "BBBB", "B", "I"):
     exec(fmt + "_struct = Struct('!" + fmt + "')")
     exec(fmt + "_unpack = " + fmt + "_struct.unpack_from")
     exec(fmt + "_pack = " + fmt + "_struct.pack")
@@ -42,6 +42,6 @@ from pg8000 import dbapi as DBAPI
 pg8000_dbapi = DBAPI
 
 from pg8000.errors import Warning, DatabaseError
-from pg8000.pg8000_types import Bytea
+from pg8000.pg8000_types import Bytea, Macaddr, Range
 
-__all__ = [Warning, Bytea, DatabaseError]
+__all__ = [Warning, Bytea, Macaddr, Range, DatabaseError]
@@ -0,0 +1,781 @@
+# vim: sw=4:expandtab:foldmethod=marker
+#
+# Copyright (c) 2007-2009, Mathieu Fenniak
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# * The name of the author may not be used to endorse or promote products
+# derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+__author__ = "Mathieu Fenniak"
+
+import asyncio
+import socket
+import time
+from collections import deque
+from sys import exc_info
+from pg8000 import dbapi, ii_pack, ci_unpack
+from pg8000.pool import PoolStats
+from pg8000.dbapi import (
+    Connection, Cursor, PreparedStatement, READY_FOR_QUERY, TERMINATE)
+from pg8000.errors import (
+    Error, InterfaceError, InternalError, ProgrammingError,
+    CursorClosedError, ConnectionClosedError, PoolTimeoutError,
+    PoolClosedError)
+
+
+##
+# The largest number of bytes read from the server at once.
+READ_SIZE = 64 * 1024
+
+
+##
+# Creates a connection to a PostgreSQL database, using asyncio streams.  The
+# arguments are the same as those of {@link #connect pg8000.dbapi.connect},
+# apart from socket_timeout, which only limits the time taken to open the
+# connection.
+# <p>
+# Stability: Added in v1.09.
+#
+# @return An instance of {@link #AsyncConnection AsyncConnection}.
+async def connect(
+        user, host='localhost', unix_sock=None, port=5432, database=None,
+        password=None, socket_timeout=60, ssl=False, options=None,
+        startup_params=None):
+    conn = AsyncConnection(user, password)
+    await conn._connect(
+        host, unix_sock, port, database, socket_timeout, ssl, options,
+        startup_params)
+    return conn
+
+
+##
+# A connection to a PostgreSQL database for use with asyncio.  It uses the
+# type conversions and protocol message handlers of
+# {@link #ConnectionWrapper ConnectionWrapper}, but reads the server's
+# responses from an asyncio stream, so that waiting for a query doesn't block
+# a thread.
+# <p>
+# The connection can be shared by many tasks.  Each round trip to the server
+# holds an asyncio lock, so statements from different tasks are sent one
+# after the other, as with threads sharing a ConnectionWrapper.
+# <p>
+# Stability: Added in v1.09.
+class AsyncConnection(Connection):
+    def __init__(self, user, password):
+        self.user = user
+        self.password = password
+        self._init_protocol()
+        self._lock = asyncio.Lock()
+        self._sock = None
+        self._read_buffer = b""
+
+    async def _connect(
+            self, host, unix_sock, port, database, socket_timeout, ssl,
+            options=None, startup_params=None):
+        startup = self._startup_packet(
+            self.user, database, options, startup_params)
+        if unix_sock is None and host is not None:
+            opening = asyncio.open_connection(host, port)
+        elif unix_sock is not None:
+            if not hasattr(socket, "AF_UNIX"):
+                raise InterfaceError(
+                    "attempt to connect to unix socket on unsupported "
+                    "platform")
+            opening = asyncio.open_unix_connection(unix_sock)
+        else:
+            raise ProgrammingError(
+                "one of host or unix_sock must be provided")
+        try:
+            reader, writer = await asyncio.wait_for(opening, socket_timeout)
+            if ssl:
+                await self._start_ssl(reader, writer)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            raise InterfaceError("communication error", exc_info()[1])
+
+        self._address = (host, unix_sock, port, socket_timeout)
+        self._reader = reader
+        self._sock = writer
+        self._write = writer.write
+        # writes are sent by the transport as soon as it can
+        self._flush = lambda: None
+
+        async with self._lock:
+            self._send_startup(startup)
+            await self._handle_messages(None)
+            self._begin = await self._prepare("BEGIN TRANSACTION")
+            self._commit = await self._prepare("COMMIT TRANSACTION")
+            self._rollback = await self._prepare("ROLLBACK TRANSACTION")
+
+    async def _start_ssl(self, reader, writer):
+        import ssl as sslmodule
+        # Int32(8) - Message length, including self.
+        # Int32(80877103) - The SSL request code.
+        writer.write(ii_pack(8, 80877103))
+        if await reader.readexactly(1) != b"S":
+            raise InterfaceError("Server refuses SSL")
+        if not hasattr(writer, "start_tls"):
+            raise InterfaceError(
+                "SSL requires Python 3.11 or later with pg8000.aio")
+        # like the blocking connection, the server's certificate isn't
+        # verified
+        context = sslmodule.SSLContext(sslmodule.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = sslmodule.CERT_NONE
+        await writer.start_tls(context)
+
+    # The message handlers send their own messages, such as the Execute
+    # after a portal's RowDescription, so this reads the messages of one
+    # round trip and passes them to the same handlers as handle_messages.
+    # The stream is read in large pieces, and whatever follows the
+    # ReadyForQuery is kept for the next round trip.  Called with self._lock
+    # held.
+    async def _handle_messages(self, ps):
+        if self._sock is None:
+            raise ConnectionClosedError()
+        message_code = None
+        error = None
+        buf = self._read_buffer
+        pos = 0
+        try:
+            self._sock_lock.acquire()
+            await self._sock.drain()
+            while message_code != READY_FOR_QUERY:
+                while len(buf) - pos < 5:
+                    buf = buf[pos:] + await self._read()
+                    pos = 0
+                message_code, data_len = ci_unpack(buf, pos)
+                end = pos + 1 + data_len
+                while len(buf) < end:
+                    buf = buf[pos:] + await self._read()
+                    end -= pos
+                    pos = 0
+                data = buf[pos + 5:end]
+                pos = end
+                try:
+                    self.message_types[message_code](data, ps)
+                except KeyError:
+                    raise InternalError(
+                        "Unrecognised message code " + message_code)
+                except Error:
+                    e = exc_info()[1]
+                    if ps is None:
+                        raise e
+                    elif error is None:
+                        # later errors are usually a consequence of the first
+                        error = e
+        except OSError:
+            self._abandon()
+            raise InterfaceError("communication error", exc_info()[1])
+        except BaseException:
+            # Cancelled, or failed, part way through the round trip.  The
+            # rest of its responses would be read by the next statement, so
+            # the connection can't be used any more.
+            self._abandon()
+            raise
+        finally:
+            self._read_buffer = buf[pos:]
+            self._sock_lock.release()
+        if error is not None:
+            raise error
+
+    def _send_messages(self, *messages):
+        # the writer of a closed connection would only log a warning
+        if self._sock is None:
+            raise ConnectionClosedError()
+        Connection._send_messages(self, *messages)
+
+    # Closes the socket without waiting, leaving the connection closed.
+    def _abandon(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    async def _read(self):
+        data = await self._reader.read(READ_SIZE)
+        if len(data) == 0:
+            raise InterfaceError("communication error", "connection lost")
+        return data
+
+    # PreparedStatement, parse and close_statement are shared with the
+    # blocking connection.  Here they only send their messages, and the
+    # response is read by the caller with _handle_messages.  close_portal
+    # is inherited, as it sends nothing itself.
+    def parse(self, ps, statement):
+        self._send_messages(*self._make_PARSE(ps, statement))
+
+    def bind(self, ps, values):
+        self.binding = True
+        self._send_messages(
+            *(self._take_portal_closes() + self._make_BIND(ps, values)))
+
+    def close_statement(self, ps):
+        self._send_messages(self._make_CLOSE(b"S", ps), dbapi.SYNC)
+
+    async def _prepare(self, query, values=None, statement_name=None):
+        ps = PreparedStatement(self, query, values, statement_name)
+        await self._handle_messages(ps)
+        return ps
+
+    async def _execute(self, ps, values):
+        ps._begin_execute(None)
+        if self._needs_begin(ps):
+            # as in ConnectionWrapper.bind, BEGIN goes in front of the
+            # statement, and the binding flag is only set for the statement
+            self._send_messages(*self._make_BEGIN())
+            self.bind(ps, ps.make_args(values))
+            self.binding = False
+            try:
+                await self._handle_messages(self._begin)
+            finally:
+                self.binding = True
+                await self._handle_messages(ps)
+        else:
+            self.bind(ps, ps.make_args(values))
+            await self._handle_messages(ps)
+        if len(ps.portal_row_desc) == 0:
+            self.close_portal(ps)
+
+    async def _read_tuple(self, ps):
+        if len(ps._cached_rows) == 0:
+            if ps.portal_suspended:
+                async with self._lock:
+                    self.send_EXECUTE(ps, PreparedStatement.row_cache_size)
+                    await self._handle_messages(ps)
+            if len(ps._cached_rows) == 0:
+                if len(ps.portal_row_desc) == 0:
+                    raise ProgrammingError("no result set")
+                self.close_portal(ps)
+                return None
+        return ps._cached_rows.popleft()
+
+    ##
+    # Creates an {@link #AsyncCursor AsyncCursor} bound to this connection.
+    # <p>
+    # Stability: Added in v1.09.
+    def cursor(self):
+        return AsyncCursor(self)
+
+    ##
+    # Begins a new transaction, if one isn't already open and autocommit is
+    # off.  There's no need to call it before executing a statement, since
+    # a transaction is begun along with the statement.
+    # <p>
+    # Stability: Added in v1.09.
+    async def begin(self):
+        async with self._lock:
+            if self._needs_begin(None):
+                self._send_messages(*self._make_BEGIN())
+                await self._handle_messages(self._begin)
+
+    ##
+    # Commits the current database transaction.
+    # <p>
+    # Stability: Added in v1.09.
+    async def commit(self):
+        async with self._lock:
+            if self._sock is None:
+                raise ConnectionClosedError()
+            if self._ready_status != "Idle":
+                await self._execute(self._commit, None)
+
+    ##
+    # Rolls back the current database transaction.
+    # <p>
+    # Stability: Added in v1.09.
+    async def rollback(self):
+        async with self._lock:
+            if self._sock is None:
+                raise ConnectionClosedError()
+            if self._ready_status != "Idle":
+                await self._execute(self._rollback, None)
+
+    ##
+    # Checks that the server is still answering, like
+    # {@link #ConnectionWrapper.ping ConnectionWrapper.ping}.
+    # <p>
+    # Stability: Added in v1.09.
+    async def ping(self):
+        async with self._lock:
+            self._send_messages(dbapi.SYNC)
+            await self._handle_messages(None)
+
+    ##
+    # Closes the database connection.
+    # <p>
+    # Stability: Added in v1.09.
+    async def close(self):
+        async with self._lock:
+            if self._sock is None:
+                raise ConnectionClosedError()
+            writer = self._sock
+            try:
+                self._send_messages(TERMINATE)
+                writer.close()
+                await writer.wait_closed()
+            except OSError:
+                pass
+            finally:
+                self._sock = None
+
+
+##
+# The cursor of an {@link #AsyncConnection AsyncConnection}.  It has the
+# methods of {@link #CursorWrapper CursorWrapper} for running queries and
+# reading results, but they're coroutines.  The rows of a result are read
+# from the server in batches as they're fetched, and an AsyncCursor can be
+# iterated over with async for.
+# <p>
+# Stability: Added in v1.09.
+class AsyncCursor(object):
+    def __init__(self, connection):
+        self._conn = connection
+        self._stmt = None
+        self.arraysize = 1
+        self._row_count = -1
+
+    rowcount = Cursor.rowcount
+    description = Cursor.description
+    _getDescription = Cursor._getDescription
+
+    ##
+    # Executes a database operation.  Parameters may be provided as a
+    # sequence or mapping and will be bound to variables in the operation.
+    # <p>
+    # Stability: Added in v1.09.
+    async def execute(self, operation, args=()):
+        if self._conn is None:
+            raise CursorClosedError()
+        self._row_count = -1
+        async with self._conn._lock:
+            if self._stmt is not None:
+                self._conn.close_portal(self._stmt)
+            self._stmt = await self._conn._prepare(
+                operation, args, statement_name="")
+            await self._conn._execute(self._stmt, args)
+        self._row_count = self._stmt.row_count
+
+    ##
+    # Prepares a database operation and then executes it against all the
+    # parameter sequences or mappings provided.
+    # <p>
+    # Stability: Added in v1.09.
+    async def executemany(self, operation, parameter_sets):
+        if self._conn is None:
+            raise CursorClosedError()
+        self._row_count = -1
+        async with self._conn._lock:
+            if self._stmt is not None:
+                self._conn.close_portal(self._stmt)
+            self._stmt = await self._conn._prepare(
+                operation, parameter_sets[0], statement_name="")
+            for parameters in parameter_sets:
+                await self._conn._execute(self._stmt, parameters)
+                if self._stmt.row_count == -1:
+                    self._row_count = -1
+                elif self._row_count == -1:
+                    self._row_count = self._stmt.row_count
+                else:
+                    self._row_count += self._stmt.row_count
+
+    ##
+    # Fetches the next row of a query result set, returning a single
+    # sequence, or None when no more data is available.
+    # <p>
+    # Stability: Added in v1.09.
+    async def fetchone(self):
+        if self._stmt is None:
+            raise ProgrammingError("attempting to use unexecuted cursor")
+        return await self._conn._read_tuple(self._stmt)
+
+    ##
+    # Fetches the next set of rows of a query result, returning a sequence of
+    # sequences.  An empty sequence is returned when no more rows are
+    # available.
+    # <p>
+    # Stability: Added in v1.09.
+    # @param size   The number of rows to fetch when called.  If not provided,
+    #               the arraysize property value is used instead.
+    async def fetchmany(self, size=None):
+        if size is None:
+            size = self.arraysize
+        rows = []
+        for i in range(size):
+            value = await self.fetchone()
+            if value is None:
+                break
+            rows.append(value)
+        return rows
+
+    ##
+    # Fetches all remaining rows of a query result, returning them as a
+    # sequence of sequences.
+    # <p>
+    # Stability: Added in v1.09.
+    async def fetchall(self):
+        rows = []
+        while True:
+            value = await self.fetchone()
+            if value is None:
+                return tuple(rows)
+            rows.append(value)
+
+    ##
+    # Closes the cursor.
+    # <p>
+    # Stability: Added in v1.09.
+    async def close(self):
+        if self._conn is None:
+            raise CursorClosedError()
+        if self._stmt is not None:
+            self._conn.close_portal(self._stmt)
+        self._stmt = None
+        self._conn = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        row = await self.fetchone()
+        if row is None:
+            raise StopAsyncIteration()
+        return row
+
+    def setinputsizes(self, sizes):
+        pass
+
+    def setoutputsize(self, size, column=None):
+        pass
+
+
+##
+# A pool of {@link #AsyncConnection AsyncConnection}s for asyncio tasks.
+# <p>
+# The pool opens min_size connections in the background as soon as it's
+# used, one at a time.  Tasks waiting for a connection are served in the
+# order they asked.  Connections are taken with acquire, which can be
+# awaited or used with async with, and given back with release.
+# <p>
+# Stability: Added in v1.09.
+class AsyncConnectionPool(object):
+
+    ##
+    # The arguments are as those of
+    # {@link #ConnectionPool pg8000.pool.ConnectionPool}, the connect_args
+    # being passed to {@link #connect connect}.
+    def __init__(
+            self, connect_args, min_size=0, max_size=10, timeout=30.0,
+            max_lifetime=None, max_idle=None, check_idle=1.0):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ProgrammingError(
+                "pool sizes must satisfy 0 <= min_size <= max_size and "
+                "max_size >= 1")
+        self.connect_args = connect_args
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_idle = check_idle
+
+        ##
+        # The {@link #PoolStats PoolStats} of the pool.
+        self.stats = PoolStats()
+        self._closed = False
+        self._warm_up_task = None
+        self._warm_up_error = None
+        # (connection, idle since), most recently returned on the right
+        self._idle = deque()
+        # id(connection) -> (connection, time opened)
+        self._connections = {}
+        self._in_use = set()
+        # futures of the tasks waiting for a connection, oldest first
+        self._waiters = deque()
+        # the connections open or being opened
+        self._size = 0
+
+    ##
+    # The number of connections open, whether idle or in use.
+    size = property(lambda self: self._size)
+
+    ##
+    # The number of idle connections.
+    idle = property(lambda self: len(self._idle))
+
+    ##
+    # The number of tasks waiting for a connection.
+    waiting = property(lambda self: len(self._waiters))
+
+    def _start(self):
+        if self._warm_up_task is None:
+            self._warm_up_task = asyncio.ensure_future(self._warm_up())
+
+    async def _warm_up(self):
+        while not self._closed and self._size < self.min_size:
+            self._size += 1
+            try:
+                conn = await self._open()
+            except Exception:
+                self._warm_up_error = exc_info()[1]
+                return
+            self._hand_over(conn)
+
+    ##
+    # Starts opening min_size connections, if that isn't already under way.
+    # <p>
+    # Stability: Added in v1.09.
+    #
+    # @param wait   If true, waits until they're open, and raises the error
+    # of a connection that couldn't be opened.
+    async def open(self, wait=True):
+        if self._closed:
+            raise PoolClosedError()
+        self._start()
+        if wait:
+            await asyncio.shield(self._warm_up_task)
+            if self._warm_up_error is not None:
+                error = self._warm_up_error
+                self._warm_up_error = None
+                raise error
+
+    async def _open(self):
+        # called after counting the connection in self._size
+        try:
+            conn = await connect(**self.connect_args)
+        except BaseException:
+            self._size -= 1
+            raise
+        self._connections[id(conn)] = (conn, time.monotonic())
+        self.stats.connects += 1
+        if self._closed:
+            await self._drop(conn)
+            raise PoolClosedError()
+        return conn
+
+    async def _open_for_waiter(self):
+        try:
+            conn = await self._open()
+        except Exception:
+            return
+        self._hand_over(conn)
+
+    def _hand_over(self, conn):
+        while len(self._waiters) > 0:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._in_use.add(id(conn))
+                waiter.set_result(conn)
+                return
+        self._idle.append((conn, time.monotonic()))
+
+    async def _drop(self, conn, close=True):
+        self._forget(conn)
+        if close:
+            try:
+                await conn.close()
+            except Exception:
+                pass
+
+    def _abandon(self, conn):
+        # Drops a connection whose task was cancelled in the middle of a
+        # round trip, closing the socket without waiting.
+        self._forget(conn)
+        conn._abandon()
+
+    def _forget(self, conn):
+        del self._connections[id(conn)]
+        self._in_use.discard(id(conn))
+        self._size -= 1
+        self.stats.closes += 1
+        if not self._closed and len(self._waiters) > 0 and \
+                self._size < self.max_size:
+            # replace the connection for the longest waiting task
+            self._size += 1
+            asyncio.ensure_future(self._open_for_waiter())
+
+    def _expired(self, conn, now):
+        return self.max_lifetime is not None and \
+            now - self._connections[id(conn)][1] > self.max_lifetime
+
+    ##
+    # Takes a connection from the pool.  The result can be awaited, giving
+    # the connection, which must be given back with release:
+    # <pre>
+    # conn = await pool.acquire()
+    # </pre>
+    # or used with async with, which releases the connection at the end:
+    # <pre>
+    # async with pool.acquire() as conn:
+    # </pre>
+    # <p>
+    # Stability: Added in v1.09.
+    #
+    # @param timeout    The number of seconds to wait, or None for the
+    # timeout of the pool.  Raises {@link #PoolTimeoutError PoolTimeoutError}
+    # if no connection is available in time.
+    def acquire(self, timeout=None):
+        return PoolAcquireContext(self, timeout)
+
+    async def _acquire(self, timeout):
+        if timeout is None:
+            timeout = self.timeout
+        if self._closed:
+            raise PoolClosedError()
+        self._start()
+        begin_time = time.monotonic()
+        waited = False
+        while True:
+            if self._closed:
+                raise PoolClosedError()
+            if len(self._idle) > 0 and len(self._waiters) == 0:
+                conn, idle_since = self._idle.pop()
+                now = time.monotonic()
+                if self._expired(conn, now):
+                    await self._drop(conn)
+                    continue
+                if self.check_idle is not None and \
+                        now - idle_since >= self.check_idle:
+                    try:
+                        await conn.ping()
+                    except Exception:
+                        await self._drop(conn)
+                        continue
+                    except BaseException:
+                        self._abandon(conn)
+                        raise
+                self._in_use.add(id(conn))
+            elif self._size < self.max_size and len(self._waiters) == 0:
+                self._size += 1
+                conn = await self._open()
+                self._in_use.add(id(conn))
+            else:
+                waiter = asyncio.get_event_loop().create_future()
+                self._waiters.append(waiter)
+                waited = True
+                remaining = begin_time + timeout - time.monotonic()
+                try:
+                    conn = await asyncio.wait_for(waiter, max(remaining, 0))
+                except BaseException:
+                    if waiter.done() and not waiter.cancelled() and \
+                            waiter.exception() is None:
+                        # handed a connection just as the wait ended
+                        await self.release(waiter.result())
+                    if isinstance(exc_info()[1], asyncio.TimeoutError):
+                        self.stats.timeouts += 1
+                        raise PoolTimeoutError()
+                    raise
+                finally:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+
+            wait = time.monotonic() - begin_time
+            self.stats.checkouts += 1
+            if waited:
+                self.stats.waits += 1
+                self.stats.wait_seconds += wait
+                self.stats.max_wait_seconds = max(
+                    self.stats.max_wait_seconds, wait)
+            return conn
+
+    ##
+    # Gives a connection taken with acquire back to the pool.  Its
+    # transaction is rolled back, and autocommit is turned off again.  A
+    # connection that is broken, closed or too old is closed instead of being
+    # kept.
+    # <p>
+    # Stability: Added in v1.09.
+    async def release(self, conn):
+        if id(conn) not in self._in_use:
+            raise ProgrammingError("connection isn't one taken from the pool")
+        self._in_use.remove(id(conn))
+        if conn._sock is None:
+            await self._drop(conn, close=False)
+            return
+        try:
+            if conn.in_transaction:
+                await conn.rollback()
+            conn.autocommit = False
+        except Exception:
+            await self._drop(conn)
+            return
+        except BaseException:
+            self._abandon(conn)
+            raise
+
+        now = time.monotonic()
+        if self._closed or self._expired(conn, now):
+            await self._drop(conn)
+        else:
+            self._hand_over(conn)
+
+        # close the connections beyond min_size that have been idle too long
+        while len(self._idle) > 0 and self.max_idle is not None and \
+                now - self._idle[0][1] > self.max_idle and \
+                self._size > self.min_size:
+            await self._drop(self._idle.popleft()[0])
+
+    ##
+    # Closes the idle connections of the pool, and makes the tasks waiting
+    # for a connection raise {@link #PoolClosedError PoolClosedError}.
+    # Connections in use are closed when they're released.
+    # <p>
+    # Stability: Added in v1.09.
+    async def close(self):
+        self._closed = True
+        if self._warm_up_task is not None:
+            self._warm_up_task.cancel()
+        while len(self._waiters) > 0:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(PoolClosedError())
+        while len(self._idle) > 0:
+            await self._drop(self._idle.popleft()[0])
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+##
+# The object returned by {@link #AsyncConnectionPool.acquire acquire}.
+class PoolAcquireContext(object):
+    def __init__(self, pool, timeout):
+        self.pool = pool
+        self.timeout = timeout
+        self.conn = None
+
+    def __await__(self):
+        return self.pool._acquire(self.timeout).__await__()
+
+    async def __aenter__(self):
+        self.conn = await self.pool._acquire(self.timeout)
+        return self.conn
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        conn = self.conn
+        self.conn = None
+        await self.pool.release(conn)
@@ -0,0 +1,501 @@
+# vim: sw=4:expandtab:foldmethod=marker
+#
+# Copyright (c) 2007-2009, Mathieu Fenniak
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# * The name of the author may not be used to endorse or promote products
+# derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = "Mathieu Fenniak"
+
+import os
+import threading
+import time
+import uuid
+from hashlib import md5
+from sys import exc_info
+from pg8000 import dbapi
+from pg8000.errors import DataError, CommitPreparedError
+from pg8000.six.moves import queue
+from pg8000.six import string_types
+
+
+##
+# The number of seconds that the threads of a parallel load wait on a queue
+# before checking whether the load has failed or finished.
+QUEUE_POLL_INTERVAL = 0.1
+
+
+##
+# Statistics for a COPY.
+# <p>
+# Stability: Added in v1.09.
+class CopyStats(object):
+    def __init__(self):
+        ##
+        # The number of rows copied, as reported by the server.
+        self.rows = 0
+
+        ##
+        # The number of bytes of COPY data, or None if not known.
+        self.bytes = None
+
+        ##
+        # The time the COPY took, in seconds.
+        self.seconds = 0.0
+
+    rows_per_second = property(
+        lambda self: self.rows / self.seconds if self.seconds else 0.0)
+
+    bytes_per_second = property(
+        lambda self: self.bytes / self.seconds
+        if self.seconds and self.bytes is not None else 0.0)
+
+    def __repr__(self):
+        return "<CopyStats %s rows, %s bytes in %.3f seconds>" % (
+            self.rows, self.bytes, self.seconds)
+
+
+##
+# Statistics for one worker of a parallel load.  The bytes are those of the
+# worker's part of the file, or None when loading an iterable of rows.
+# <p>
+# Stability: Added in v1.09.
+class CopyWorkerStats(CopyStats):
+    def __init__(self, worker):
+        CopyStats.__init__(self)
+
+        ##
+        # The number of the worker, from 0.
+        self.worker = worker
+
+    def __repr__(self):
+        return "<CopyWorkerStats worker %s: %s rows in %.3f seconds>" % (
+            self.worker, self.rows, self.seconds)
+
+
+##
+# A file-like object for reading a byte range of a file, so that a worker
+# can COPY its share of the file.
+class FileRange(object):
+    def __init__(self, path, start, end):
+        self.file = open(path, "rb")
+        self.file.seek(start)
+        self.remaining = end - start
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def readinto(self, bffr):
+        if len(bffr) > self.remaining:
+            bffr = memoryview(bffr)[:self.remaining]
+        bytes_read = self.file.readinto(bffr)
+        self.remaining -= bytes_read
+        return bytes_read
+
+    def close(self):
+        self.file.close()
+
+
+##
+# Returns the offsets at which a file can be split into the given number of
+# parts, each starting at the beginning of a line.  The list starts with 0
+# and ends with the size of the file; parts may be empty.
+def split_lines(path, parts):
+    size = os.path.getsize(path)
+    offsets = [0]
+    f = open(path, "rb")
+    try:
+        for i in range(1, parts):
+            offset = max(size * i // parts, offsets[-1])
+            if offset > 0:
+                f.seek(offset - 1)
+                f.readline()
+                offset = min(f.tell(), size)
+            offsets.append(offset)
+    finally:
+        f.close()
+    offsets.append(size)
+    return offsets
+
+
+def make_copy_query(table, columns, sep, null):
+    query = "COPY " + table
+    if columns is not None:
+        query += " (" + ", ".join(columns) + ")"
+    query += " FROM stdout DELIMITER '%s'" % (sep,)
+    if null is not None:
+        query += " NULL '%s'" % (null,)
+    return query
+
+
+##
+# Puts a batch of rows on a worker's queue for a parallel load.  Returns False
+# if the load has failed, so there's no point feeding it more.
+def feed_batch(batch_queue, batch, failed):
+    while not failed.is_set():
+        try:
+            batch_queue.put(batch, timeout=QUEUE_POLL_INTERVAL)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+##
+# Loads a file or an iterable of rows into a table over several connections
+# at once, so that the work of parsing and inserting the rows is spread over
+# several server processes.
+# <p>
+# If source is a path, the file is split into one part per worker on line
+# boundaries, and each worker loads its part with a text format COPY.  The
+# file must be in the text format of COPY (or the format given by query) with
+# one row per line, so CSV with quoted newlines and header lines can't be
+# used.  Otherwise source is an iterable of rows, which is read in batches of
+# batch_size rows that are dealt out to the workers in turn, and loaded with
+# Cursor.copy_from_rows.  A worker that falls behind holds up the others once
+# its queue is full.
+# <p>
+# Each worker runs in its own thread with its own connection, made with
+# dbapi.connect(**connect_args).  The load is all or nothing: the
+# transactions of the workers are only committed once every worker has
+# finished, and are all rolled back if any fails.  With two_phase, each
+# transaction is first prepared with PREPARE TRANSACTION, so that a failure
+# while committing can't lose part of the load.  If COMMIT PREPARED fails for
+# some of the transactions the rest are still committed, and a
+# CommitPreparedError gives the ids of those left outstanding.  This needs the
+# server's max_prepared_transactions to be at least the number of workers.
+# <p>
+# Because the transactions are open until the whole load has finished, rows
+# with the same unique key must not be loaded by different workers: the
+# second would wait for the first worker's transaction to end, which it
+# never does.
+# <p>
+# Stability: Added in v1.09.
+#
+# @param source A path to a file, or an iterable of sequences of values.
+#
+# @param table  The name of the table to load.
+#
+# @param connect_args   A dict of the keyword arguments for dbapi.connect.
+#
+# @param workers    The number of connections to load with.
+#
+# @param columns    A sequence of column names, or None for all the columns
+# of the table in order.
+#
+# @param query  A COPY ... FROM STDIN query to use for a file, instead of
+# the one made from table, columns, sep and null.
+#
+# @return   A list of CopyWorkerStats, one for each worker.
+def copy_from_parallel(
+        source, table, connect_args, workers=4, sep='\t', null=None,
+        columns=None, query=None, batch_size=1000, two_phase=False):
+    stats = [CopyWorkerStats(i) for i in range(workers)]
+    connections = [None] * workers
+    prepared = [None] * workers
+    errors = []
+    failed = threading.Event()
+    if isinstance(source, string_types):
+        if query is None:
+            query = make_copy_query(table, columns, sep, null)
+        offsets = split_lines(source, workers)
+    else:
+        # a queue of batches of rows for each worker.  The batches are dealt
+        # out in turn, since a shared queue would be drained by the first
+        # worker to connect.
+        batches = [queue.Queue(2) for i in range(workers)]
+        fed = threading.Event()
+
+    def iterate_batches(i):
+        while True:
+            if failed.is_set():
+                raise DataError("parallel COPY aborted")
+            try:
+                batch = batches[i].get(timeout=QUEUE_POLL_INTERVAL)
+            except queue.Empty:
+                if fed.is_set() and batches[i].empty():
+                    return
+                continue
+            for row in batch:
+                yield row
+
+    def run(i):
+        try:
+            conn = connections[i] = dbapi.connect(**connect_args)
+            cursor = conn.cursor()
+            begin_time = time.time()
+            if isinstance(source, string_types):
+                stats[i].bytes = offsets[i + 1] - offsets[i]
+                stream = FileRange(source, offsets[i], offsets[i + 1])
+                try:
+                    cursor.copy_from(stream, query=query)
+                finally:
+                    stream.close()
+            else:
+                cursor.copy_from_rows(
+                    table, iterate_batches(i), sep, null, columns)
+            stats[i].rows = cursor.rowcount
+            if two_phase:
+                gid = "pg8000_copy_%s_%s" % (uuid.uuid4().hex, i)
+                cursor.execute("PREPARE TRANSACTION '%s'" % (gid,))
+                prepared[i] = gid
+            stats[i].seconds = time.time() - begin_time
+        except Exception:
+            errors.append(exc_info()[1])
+            failed.set()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        if not isinstance(source, string_types):
+            batch = []
+            worker = 0
+            for row in source:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    if not feed_batch(batches[worker], batch, failed):
+                        break
+                    batch = []
+                    worker = (worker + 1) % workers
+            else:
+                if len(batch) > 0:
+                    feed_batch(batches[worker], batch, failed)
+    except Exception:
+        errors.append(exc_info()[1])
+        failed.set()
+    finally:
+        if not isinstance(source, string_types):
+            fed.set()
+        for thread in threads:
+            thread.join()
+
+    try:
+        if len(errors) > 0:
+            for conn, gid in zip(connections, prepared):
+                if conn is None:
+                    continue
+                try:
+                    finish_transaction(conn, gid, "ROLLBACK")
+                except Exception:
+                    pass
+            raise errors[0]
+        if not two_phase:
+            for conn in connections:
+                finish_transaction(conn, None, "COMMIT")
+            return stats
+        # Every prepared transaction is committed even if some fail, since
+        # closing the connections doesn't end them, and those left behind
+        # keep their locks.
+        outstanding = []
+        commit_errors = []
+        for conn, gid in zip(connections, prepared):
+            try:
+                finish_transaction(conn, gid, "COMMIT")
+            except Exception:
+                outstanding.append(gid)
+                commit_errors.append(exc_info()[1])
+        if len(outstanding) > 0:
+            raise CommitPreparedError(
+                "COMMIT PREPARED failed for " + ", ".join(outstanding),
+                outstanding, commit_errors)
+    finally:
+        for conn in connections:
+            if conn is not None:
+                conn.close()
+    return stats
+
+
+##
+# Commits or rolls back the transaction of a worker, which has been prepared
+# as gid if gid isn't None.
+def finish_transaction(conn, gid, command):
+    if gid is None:
+        if command == "COMMIT":
+            conn.commit()
+        else:
+            conn.rollback()
+    else:
+        conn.autocommit = True
+        conn.cursor().execute("%s PREPARED '%s'" % (command, gid))
+
+
+##
+# Copies the rows of a query on one connection into a table on another,
+# passing the COPY data from the source's COPY ... TO STDOUT straight into
+# the destination's COPY ... FROM STDIN without a file in between.  The
+# source is read by a background thread at most a few chunks of
+# copy_chunk_size bytes ahead of the destination.
+# <p>
+# Neither connection's transaction is committed.
+# <p>
+# Stability: Added in v1.09.
+#
+# @param src_conn   The connection to copy from.
+#
+# @param src_query  A SELECT query, or any query that can be used as a
+# subquery, giving the rows to copy.
+#
+# @param dst_conn   The connection to copy to.
+#
+# @param dst_table  The name of the table to copy into.
+#
+# @param columns    A sequence of the names of the destination columns, or
+# None for all the columns of the table in order.
+#
+# @param binary Whether to use the binary format of COPY.  This saves the
+# servers formatting and parsing text, but needs the column types on both
+# sides to match exactly.
+#
+# @return   A CopyStats.
+def relay(
+        src_conn, src_query, dst_conn, dst_table, columns=None,
+        binary=False):
+    options = " WITH (FORMAT binary)" if binary else ""
+    src_query = "COPY (%s) TO STDOUT%s" % (src_query, options)
+    dst_query = "COPY " + dst_table
+    if columns is not None:
+        dst_query += " (" + ", ".join(columns) + ")"
+    dst_query += " FROM STDIN" + options
+
+    stats = CopyStats()
+    stats.bytes = 0
+
+    def count_bytes(chunks):
+        for chunk in chunks:
+            stats.bytes += len(chunk)
+            yield chunk
+
+    src_cursor = src_conn.cursor()
+    dst_cursor = dst_conn.cursor()
+    begin_time = time.time()
+    chunks = src_cursor.copy_to_iter(src_query)
+    try:
+        dst_cursor.execute(dst_query, stream=count_bytes(chunks))
+    except Exception:
+        # The source's COPY only starts when the destination reads the
+        # first chunk, so if the destination failed before that, as when
+        # dst_table doesn't exist, closing does nothing.  Otherwise the
+        # rest of the source is read, so that its connection stays usable.
+        chunks.close()
+        raise
+    chunks.close()
+    stats.seconds = time.time() - begin_time
+    stats.rows = dst_cursor.rowcount
+    return stats
+
+
+##
+# Statistics for an upsert.
+# <p>
+# Stability: Added in v1.09.
+class UpsertStats(CopyStats):
+    def __init__(self):
+        CopyStats.__init__(self)
+
+        ##
+        # The number of rows inserted into the table.
+        self.inserted = 0
+
+        ##
+        # The number of rows of the table updated.
+        self.updated = 0
+
+    def __repr__(self):
+        return "<UpsertStats %s rows, %s inserted, %s updated in %.3f " \
+            "seconds>" % (self.rows, self.inserted, self.updated, self.seconds)
+
+
+##
+# Inserts rows into a table, updating the rows that already exist, with a
+# single statement.  The rows are first loaded with a binary COPY into a
+# temporary staging table with the same column types as the table, and then
+# inserted with INSERT ... SELECT ... ON CONFLICT (key_columns) DO UPDATE.
+# <p>
+# The staging table is kept for the rest of the session, so calling this
+# function repeatedly with batches of rows only creates it once.  The
+# transaction isn't committed.  The rows mustn't hold the same key more than
+# once, since a single statement can't update a row twice.  Needs PostgreSQL
+# 9.5 or later.
+# <p>
+# Stability: Added in v1.09.
+#
+# @param conn   The connection to use.
+#
+# @param table  The name of the table.
+#
+# @param columns    A sequence of the names of the columns of the rows.
+#
+# @param rows   An iterable of sequences of values, one value per column.
+#
+# @param key_columns    A sequence of the names of the columns that make up
+# the unique key on which rows conflict.
+#
+# @param update_columns A sequence of the names of the columns to update
+# when a row already exists.  Defaults to all the columns that aren't in
+# key_columns.  If empty, existing rows are left alone.
+#
+# @return   An UpsertStats.
+def upsert(conn, table, columns, rows, key_columns, update_columns=None):
+    if update_columns is None:
+        update_columns = [c for c in columns if c not in key_columns]
+    column_list = ", ".join(columns)
+    staging = "pg8000_upsert_" + md5(
+        (table + "(" + column_list + ")").encode("utf8")).hexdigest()[:16]
+
+    stats = UpsertStats()
+    cursor = conn.cursor()
+    try:
+        begin_time = time.time()
+        cursor.execute(
+            "CREATE TEMPORARY TABLE IF NOT EXISTS %s AS SELECT %s FROM %s "
+            "WITH NO DATA" % (staging, column_list, table))
+        cursor.execute("TRUNCATE " + staging)
+        cursor.copy_rows(staging, columns, rows)
+        stats.rows = cursor.rowcount
+
+        if len(update_columns) > 0:
+            action = "UPDATE SET " + ", ".join(
+                "%s = EXCLUDED.%s" % (c, c) for c in update_columns)
+        else:
+            action = "NOTHING"
+        # xmax is 0 for a newly inserted row version, and set for an update
+        cursor.execute(
+            "WITH upserted AS (INSERT INTO %s (%s) SELECT %s FROM %s "
+            "ON CONFLICT (%s) DO %s RETURNING xmax = 0 AS inserted) "
+            "SELECT count(*) FILTER (WHERE inserted), "
+            "count(*) FILTER (WHERE NOT inserted) FROM upserted" % (
+                table, column_list, column_list, staging,
+                ", ".join(key_columns), action))
+        stats.inserted, stats.updated = cursor.fetchone()
+        stats.seconds = time.time() - begin_time
+    finally:
+        cursor.close()
+    return stats
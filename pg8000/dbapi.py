@@ -34,18 +34,21 @@ from datetime import timedelta
 import time
 from pg8000.pg8000_types import (
     Interval, min_int2, max_int2, min_int4, max_int4, min_int8, max_int8,
-    Bytea)
+    Bytea, Macaddr, interval_unchecked, Range, range_unchecked, RANGE_EMPTY,
+    RANGE_LB_INF, RANGE_UB_INF)
 from pg8000.errors import (
     NotSupportedError, ProgrammingError, InternalError, IntegrityError,
-    OperationalError, DatabaseError, InterfaceError, Error,
+    OperationalError, DatabaseError, InterfaceError, Error, DataError,
     CopyQueryOrTableRequiredError, CursorClosedError, QueryParameterParseError,
     ArrayContentNotHomogenousError, ArrayContentEmptyError,
     ArrayDimensionsNotConsistentError, ArrayContentNotSupportedError, Warning,
-    CopyQueryWithoutStreamError)
+    CopyQueryWithoutStreamError, StatementTimeoutError, ConnectionClosedError)
 from warnings import warn
 import socket
 import threading
-from struct import unpack_from, pack, Struct
+import os
+import mmap
+from struct import unpack_from, pack, Struct, error as struct_error
 from hashlib import md5
 from decimal import Decimal
 import pg8000
@@ -53,16 +56,32 @@ import pg8000.util
 from pg8000 import i_unpack, ii_unpack, iii_unpack, hhhh_pack, h_pack, \
     hhhh_unpack, d_unpack, q_unpack, d_pack, f_unpack, q_pack, i_pack, \
     h_unpack, dii_unpack, qii_unpack, ci_unpack, bh_unpack, \
-    ihihih_unpack, cccc_unpack, ii_pack, iii_pack, dii_pack, qii_pack
+    ihihih_unpack, cccc_unpack, ii_pack, iii_pack, dii_pack, qii_pack, \
+    BBBB_pack, BBBB_unpack, B_pack, B_unpack, f_pack, I_unpack, i_struct
 from collections import deque, defaultdict
 from itertools import count
 from operator import itemgetter
 from pg8000.six.moves import map
+from pg8000.six.moves import queue
 from pg8000.six import (
-    b, Iterator, PY2, binary_type, integer_types, next, PRE_26)
+    b, Iterator, PY2, binary_type, integer_types, next, PRE_26, text_type,
+    string_types)
+from binascii import hexlify
 from sys import exc_info
 import uuid
 
+try:
+    from json import loads as json_loads, dumps as json_dumps
+except ImportError:
+    json_loads = json_dumps = None
+
+try:
+    from ipaddress import (
+        ip_address, ip_interface, ip_network, IPv4Address, IPv6Address,
+        IPv4Interface, IPv6Interface, IPv4Network, IPv6Network)
+except ImportError:
+    ip_address = None
+
 
 if PRE_26:
     bytearray = list
@@ -136,12 +155,6 @@ def TimestampFromTicks(ticks):
 def Binary(value):
     return pg8000.pg8000_types.Bytea(value)
 
-statement_number_lock = threading.Lock()
-statement_number = 0
-
-portal_number_lock = threading.Lock()
-portal_number = 0
-
 FC_TEXT = 0
 FC_BINARY = 1
 
@@ -323,6 +336,61 @@ def unexpected_response(message_code):
     return InternalError("Unexpected response msg " + message_code)
 
 
+# Cancels the statement that a connection is running if it hasn't finished by
+# a deadline.  The timer is started by start, once the statement holds the
+# connection's statement lock, and stopped by stop before the lock is
+# released, so that the cancel request can only reach this statement.  The
+# watchdog's own lock makes sure that the timer's thread doesn't send the
+# cancel request once stop has been called.
+class StatementWatchdog(object):
+    def __init__(self, conn, timeout, deadline):
+        if timeout is not None:
+            timeout_deadline = time.time() + timeout
+            if deadline is None or timeout_deadline < deadline:
+                deadline = timeout_deadline
+        self.conn = conn
+        self.deadline = deadline
+        self.expired = False
+        self.timer = None
+        self.lock = threading.Lock()
+
+    # Raises StatementTimeoutError if the deadline passed while waiting for
+    # the statement lock, so that the statement isn't sent at all.
+    def start(self):
+        if self.deadline is None:
+            return
+        delay = self.deadline - time.time()
+        if delay <= 0:
+            raise StatementTimeoutError("statement timed out", None)
+        self.timer = threading.Timer(delay, self.expire)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def expire(self):
+        try:
+            self.lock.acquire()
+            if self.timer is not None:
+                self.expired = True
+                self.conn.cancel()
+        finally:
+            self.lock.release()
+
+    # Raises StatementTimeoutError in place of the server's error if the
+    # statement was cancelled.
+    def check(self, e):
+        if self.expired and e.args[1:2] == (b("57014"),):
+            raise StatementTimeoutError("statement timed out", e)
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            try:
+                self.lock.acquire()
+                self.timer = None
+            finally:
+                self.lock.release()
+
+
 ##
 # The class of object returned by the {@link #ConnectionWrapper.cursor cursor
 # method}.
@@ -452,24 +520,40 @@ class Cursor(Iterator):
     # Executes a database operation.  Parameters may be provided as a sequence
     # or mapping and will be bound to variables in the operation.
     # <p>
-    # Stability: Part of the DBAPI 2.0 specification.
-    def execute(self, operation, args=(), stream=None):
+    # As an extension, a timeout or deadline can be given.  If the statement
+    # is still running when it passes, it's cancelled with
+    # {@link #ConnectionWrapper.cancel cancel}, and StatementTimeoutError is
+    # raised once the server has finished with it, leaving the connection
+    # usable.  The transaction is aborted, and must be rolled back.
+    # <p>
+    # Stability: Part of the DBAPI 2.0 specification.  The timeout and
+    # deadline arguments were added in v1.09.
+    #
+    # @param timeout    The number of seconds the statement may take.
+    #
+    # @param deadline   The time, as given by time.time(), by which the
+    # statement must have finished.
+    def execute(
+            self, operation, args=(), stream=None, timeout=None,
+            deadline=None):
         self._row_count = -1
+        if self._conn is None:
+            raise InterfaceError("Cursor closed")
 
-        try:
-            self._conn.begin()
-        except AttributeError:
-            if self._conn is None:
-                raise InterfaceError("Cursor closed")
-            else:
-                raise exc_info()[1]
-
+        watchdog = StatementWatchdog(self._conn, timeout, deadline)
         try:
             self._conn._unnamed_prepared_statement_lock.acquire()
+            watchdog.start()
+            if self._stmt is not None:
+                self._conn.close_portal(self._stmt)
             self._stmt = PreparedStatement(
                 self._conn, operation, args, statement_name="")
             self._stmt.execute(args, stream=stream)
+        except ProgrammingError:
+            watchdog.check(exc_info()[1])
+            raise
         finally:
+            watchdog.stop()
             self._conn._unnamed_prepared_statement_lock.release()
         self._row_count = self._stmt.row_count
 
@@ -477,13 +561,19 @@ class Cursor(Iterator):
     # Prepare a database operation and then execute it against all parameter
     # sequences or mappings provided.
     # <p>
-    # Stability: Part of the DBAPI 2.0 specification.
+    # Stability: Part of the DBAPI 2.0 specification.  The timeout and
+    # deadline arguments were added in v1.09, and apply to all the executions
+    # together, as with {@link #CursorWrapper.execute execute}.
     @require_open_cursor
-    def executemany(self, operation, parameter_sets):
+    def executemany(
+            self, operation, parameter_sets, timeout=None, deadline=None):
         self._row_count = -1
-        self._conn.begin()
+        watchdog = StatementWatchdog(self._conn, timeout, deadline)
         try:
             self._conn._unnamed_prepared_statement_lock.acquire()
+            watchdog.start()
+            if self._stmt is not None:
+                self._conn.close_portal(self._stmt)
             self._stmt = PreparedStatement(
                 self._conn, operation, parameter_sets[0], statement_name="")
             for parameters in parameter_sets:
@@ -494,31 +584,227 @@ class Cursor(Iterator):
                     self._row_count = self.row_count
                 else:
                     self._row_count += self.row_count
+        except ProgrammingError:
+            watchdog.check(exc_info()[1])
+            raise
         finally:
+            watchdog.stop()
             self._conn._unnamed_prepared_statement_lock.release()
 
-    def copy_from(self, fileobj, table=None, sep='\t', null=None, query=None):
+    def copy_from(
+            self, fileobj, table=None, sep='\t', null=None, query=None,
+            compression=None):
         if query is None:
             if table is None:
                 raise CopyQueryOrTableRequiredError()
             query = "COPY %s FROM stdout DELIMITER '%s'" % (table, sep)
             if null is not None:
                 query += " NULL '%s'" % (null,)
+        if isinstance(fileobj, string_types):
+            if compression is None:
+                compression = compression_from_path(fileobj)
+            if compression is None:
+                return self.copy_from_path(fileobj, query=query)
+            f = open(fileobj, "rb")
+            try:
+                return self.copy_from(f, query=query, compression=compression)
+            finally:
+                f.close()
+        if compression is not None:
+            # decompress in a background thread, ahead of the COPY
+            fileobj = read_ahead(decompress_chunks(
+                fileobj, compression, self._conn.copy_chunk_size),
+                COPY_OUT_QUEUE_SIZE)
         self.copy_execute(fileobj, query)
 
-    def copy_to(self, fileobj, table=None, sep='\t', null=None, query=None):
+    ##
+    # Loads a local file into a table with COPY, sending the data straight
+    # from a memory map of the file rather than reading it into buffers.
+    # <p>
+    # Stability: Added in v1.09.
+    #
+    # @param path   The path of the file.
+    #
+    # @param table  The name of the table to load, used with sep and null to
+    # make the COPY query if query isn't given.
+    #
+    # @param query  A COPY ... FROM STDIN query.
+    @require_open_cursor
+    def copy_from_path(
+            self, path, table=None, sep='\t', null=None, query=None):
+        if query is None:
+            if table is None:
+                raise CopyQueryOrTableRequiredError()
+            query = "COPY %s FROM stdout DELIMITER '%s'" % (table, sep)
+            if null is not None:
+                query += " NULL '%s'" % (null,)
+        f = open(path, "rb")
+        try:
+            self.copy_execute(
+                mmap_chunks(f, self._conn.copy_chunk_size), query)
+        finally:
+            f.close()
+
+    def copy_to(
+            self, fileobj, table=None, sep='\t', null=None, query=None,
+            compression=None):
         if query is None:
             if table is None:
                 raise CopyQueryOrTableRequiredError()
             query = "COPY %s TO stdout DELIMITER '%s'" % (table, sep)
             if null is not None:
                 query += " NULL '%s'" % (null,)
-        self.copy_execute(fileobj, query)
+        if isinstance(fileobj, string_types):
+            if compression is None:
+                compression = compression_from_path(fileobj)
+            f = open(fileobj, "wb")
+            try:
+                return self.copy_to(f, query=query, compression=compression)
+            finally:
+                f.close()
+        if compression is None:
+            self.copy_execute(fileobj, query)
+            return
+
+        # compress in a background thread, as the data arrives
+        compressor = make_compressor(compression)
+        chunks = queue.Queue(COPY_OUT_QUEUE_SIZE)
+        errors = []
+        thread = threading.Thread(
+            target=compress_chunks, args=(chunks, compressor, fileobj, errors))
+        thread.daemon = True
+        thread.start()
+        try:
+            stream = CopyOutBuffer(chunks, self._conn.copy_chunk_size)
+            self.copy_execute(stream, query)
+            stream.flush()
+        finally:
+            chunks.put(None)
+            thread.join()
+        if len(errors) > 0:
+            raise errors[0]
+
+    ##
+    # Loads rows of Python values into a table with a text format COPY, for
+    # when a binary COPY can't be used.  Each value is converted to text and
+    # escaped, and the rows are sent in chunks as they are read from the
+    # iterable, so they are never all held in memory.
+    # <p>
+    # Stability: Added in v1.09.
+    #
+    # @param table  The name of the table to load.
+    #
+    # @param rows   An iterable of sequences of values, one value per column.
+    #
+    # @param sep    The column separator.
+    #
+    # @param null   The string that represents NULL, or None for the server's
+    # default of \N.
+    #
+    # @param columns    A sequence of column names, or None for all the columns
+    # of the table in order.
+    @require_open_cursor
+    def copy_from_rows(self, table, rows, sep='\t', null=None, columns=None):
+        query = "COPY " + table
+        if columns is not None:
+            query += " (" + ", ".join(columns) + ")"
+        query += " FROM stdout DELIMITER '%s'" % (sep,)
+        if null is None:
+            null = "\\N"
+        else:
+            query += " NULL '%s'" % (null,)
+        encode_row = self._conn.make_copy_text_encoder(sep, null)
+        self.execute(query, stream=text_copy_data(
+            encode_row, rows, self._conn.copy_chunk_size,
+            self._conn._client_encoding))
 
     @require_open_cursor
     def copy_execute(self, fileobj, query):
         self.execute(query, stream=fileobj)
 
+    ##
+    # Returns an iterator of the rows of a query, read with a binary format
+    # COPY.  Each value is decoded with the receive function of its column's
+    # type, as for a fetch, but without the per-row protocol overhead of a
+    # query.  The rows are decoded as they are read, so a large table can be
+    # extracted in bounded memory.
+    # <p>
+    # The connection can't be used by other statements until the iterator is
+    # exhausted or closed.
+    # <p>
+    # Stability: Added in v1.09.
+    #
+    # @param query  A SELECT query, or any query that can be used as a
+    # subquery.
+    @require_open_cursor
+    def copy_out_rows(self, query):
+        self.execute("SELECT * FROM (%s) AS pg8000_copy LIMIT 0" % (query,))
+        recv_funcs = self._conn.make_copy_row_decoder(
+            [col[1] for col in self.description])
+        return CopyOutIterator(
+            self, "COPY (%s) TO STDOUT WITH (FORMAT binary)" % (query,),
+            decode=lambda chunks: binary_copy_rows(recv_funcs, chunks))
+
+    ##
+    # Runs a COPY ... TO STDOUT query, returning an iterator of its data.  By
+    # default the data comes in chunks of about Connection.copy_chunk_size
+    # bytes, each holding a whole number of rows.  If lines is true, each row
+    # is returned separately, as sent by the server.
+    # <p>
+    # The query is executed by a background thread, started by the first
+    # call to next(), which stops reading from the server when the consumer
+    # falls behind, so the data is never held in memory all at once.  If the
+    # iterator is closed early the rest of the data is read and discarded.
+    # The connection can't be used by other statements from the first call
+    # to next() until the iterator is exhausted or closed.
+    # <p>
+    # Stability: Added in v1.09.
+    #
+    # @param query  A COPY ... TO STDOUT query.
+    #
+    # @param lines  Whether to return each row separately.
+    @require_open_cursor
+    def copy_to_iter(self, query, lines=False):
+        if lines:
+            return CopyOutIterator(
+                self, query, join=False,
+                decode=lambda chunks: (
+                    line for batch in chunks for line in batch))
+        return CopyOutIterator(self, query)
+
+    ##
+    # Loads rows of Python values into a table with a binary format COPY.
+    # The types of the columns are looked up first, and each value is sent
+    # in the binary format of its column's type.
+    # <p>
+    # Rows are read from the iterable as they are sent, so any iterator can
+    # be used without holding all of the rows in memory.
+    # <p>
+    # Stability: Added in v1.09.
+    #
+    # @param table  The name of the table to load.
+    #
+    # @param columns    A sequence of column names, or None for all the columns
+    # of the table in order.
+    #
+    # @param rows   An iterable of sequences of values, one value per column.
+    @require_open_cursor
+    def copy_rows(self, table, columns, rows):
+        if columns is None:
+            column_list = ""
+            self.execute("SELECT * FROM %s LIMIT 0" % (table,))
+        else:
+            column_list = " (" + ", ".join(columns) + ")"
+            self.execute(
+                "SELECT %s FROM %s LIMIT 0" % (", ".join(columns), table))
+        oids = [col[1] for col in self.description]
+        encode_row = self._conn.make_copy_row_encoder(oids)
+        self.execute(
+            "COPY %s%s FROM STDIN WITH (FORMAT binary)" % (
+                table, column_list),
+            stream=binary_copy_data(
+                encode_row, rows, self._conn.copy_chunk_size))
+
     ##
     # Fetch the next row of a query result set, returning a single sequence, or
     # None when no more data is available.
@@ -611,6 +897,7 @@ COPY_DONE = b("c")
 COPY_DATA = b("d")
 COPY_IN_RESPONSE = b("G")
 COPY_OUT_RESPONSE = b("H")
+COPY_FAIL = b("f")
 
 BIND = b("B")
 PARSE = b("P")
@@ -724,14 +1011,15 @@ class Connection(object):
 
     def __init__(
             self, user, host, unix_sock, port, database, password,
-            socket_timeout, ssl):
-        self._client_encoding = "ascii"
-        self._integer_datetimes = False
-        self._sock_lock = threading.Lock()
+            socket_timeout, ssl, options=None, startup_params=None):
         self.user = user
         self.password = password
-        self.autocommit = False
-        self.binding = False
+        self._init_protocol()
+        self._address = (host, unix_sock, port, socket_timeout)
+
+        # Bad startup parameters are reported before a socket is opened.
+        startup = self._startup_packet(
+            user, database, options, startup_params)
         try:
             if unix_sock is None and host is not None:
                 self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -744,6 +1032,7 @@ class Connection(object):
             else:
                 raise ProgrammingError(
                     "one of host or unix_sock must be provided")
+            self._sock.settimeout(socket_timeout)
             if unix_sock is None and host is not None:
                 self._sock.connect((host, port))
             elif unix_sock is not None:
@@ -768,9 +1057,6 @@ class Connection(object):
                 finally:
                     self._sock_lock.release()
 
-            # settimeout causes ssl failure, on windows.  Python bug 1462352.
-            self._sock.settimeout(socket_timeout)
-
             #self._sock_in = self._sock.makefile(mode="rb")
             #self._read_bytes = self._sock_in.read
             self._sock = self._sock.makefile(mode="rwb")
@@ -781,7 +1067,29 @@ class Connection(object):
             self._write = self._sock.writelines
         else:
             self._write = self._sock.write
+
+        self._send_startup(startup)
+        try:
+            self._sock_lock.acquire()
+            self.handle_messages(None)
+        finally:
+            self._sock_lock.release()
+
+        self._begin = PreparedStatement(self, "BEGIN TRANSACTION")
+        self._commit = PreparedStatement(self, "COMMIT TRANSACTION")
+        self._rollback = PreparedStatement(self, "ROLLBACK TRANSACTION")
+
+    # Sets up the state of the connection that doesn't depend on the socket:
+    # the type conversions and the protocol message handlers.
+    def _init_protocol(self):
+        self._client_encoding = "ascii"
+        self._integer_datetimes = False
+        self._sock_lock = threading.Lock()
+        self.autocommit = False
+        self.binding = False
         self._backend_key_data = None
+        # name -> value of the run-time parameters reported by the server
+        self._parameter_statuses = {}
 
         ##
         # An event handler that is fired when the database server issues a
@@ -821,12 +1129,12 @@ class Connection(object):
 
         self.ParameterStatusReceived += self.handle_PARAMETER_STATUS
         self.py_types = {
-            bool: (16, FC_BINARY, lambda x: b("\x01") if x else b("\x00")),
+            bool: (16, FC_BINARY, bool_send),
             float: (701, FC_BINARY, d_pack),
             Decimal: (1700, FC_BINARY, numeric_send),
             pg8000.pg8000_types.Bytea: (17, FC_BINARY, byteasend),
             type(None): (-1, FC_BINARY, lambda value: i_pack(-1)),
-            uuid.UUID: (2950, FC_BINARY, lambda v: v.bytes)}
+            uuid.UUID: (2950, FC_BINARY, uuid_send)}
 
         def textout(v):
             return v.encode(self._client_encoding)
@@ -836,9 +1144,102 @@ class Connection(object):
             return v.isoformat().encode(self._client_encoding)
         self.py_types[datetime.time] = (1083, FC_TEXT, time_out)
 
+        ##
+        # The functions used to decode json / jsonb values and to encode dict
+        # parameters.  They default to the standard library json module, but
+        # can be replaced by any compatible pair, eg. orjson.loads and
+        # orjson.dumps.  The dumps function may return either str or bytes.
+        # If json_loads is set to None, json / jsonb values are returned as
+        # the raw bytes of their JSON text without being parsed.
+        # <p>
+        # Stability: Added in v1.09.
+        self.json_loads = json_loads
+        self.json_dumps = json_dumps
+
+        def json_out(v):
+            val = self.json_dumps(v)
+            if isinstance(val, binary_type):
+                return val
+            return val.encode(self._client_encoding)
+        self.py_types[dict] = (114, FC_BINARY, json_out)
+
+        ##
+        # If True, inet and cidr values are returned as (address, prefix
+        # length) tuples, where the address is an int, rather than as
+        # ipaddress objects.  Without the ipaddress module they're always
+        # returned as strings.
+        # <p>
+        # Stability: Added in v1.09.
+        self.inet_as_int = False
+
+        if ip_address is not None:
+            for typ in (IPv4Address, IPv6Address):
+                self.py_types[typ] = (869, FC_BINARY, inet_address_send)
+            for typ in (IPv4Interface, IPv6Interface):
+                self.py_types[typ] = (869, FC_BINARY, inet_interface_send)
+            for typ in (IPv4Network, IPv6Network):
+                self.py_types[typ] = (650, FC_BINARY, cidr_send)
+
+        def copy_text(v):
+            return self.copy_text_outs.get(type(v), text_type)(v)
+
+        # Array and range elements are double-quoted, so that they can hold
+        # any text.
+        def quote_copy_text(v):
+            if v is None:
+                return "NULL"
+            elif isinstance(v, list):
+                return array_copy_text(v)
+            return '"' + copy_text(v).replace(
+                "\\", "\\\\").replace('"', '\\"') + '"'
+
+        def array_copy_text(v):
+            return "{" + ",".join(map(quote_copy_text, v)) + "}"
+
+        def range_copy_text(v):
+            if v.is_empty:
+                return "empty"
+            lower = "" if v.lower is None else quote_copy_text(v.lower)
+            upper = "" if v.upper is None else quote_copy_text(v.upper)
+            return v.bounds[0] + lower + "," + upper + v.bounds[1]
+
+        def json_copy_text(v):
+            val = self.json_dumps(v)
+            if isinstance(val, binary_type):
+                return val.decode(self._client_encoding)
+            return val
+
+        ##
+        # Python type -> function that returns the text of a value in the
+        # text format of COPY, before escaping.  Values of other types are
+        # converted with str().
+        # <p>
+        # Stability: Added in v1.09.
+        self.copy_text_outs = {
+            bool: lambda v: "t" if v else "f",
+            float: repr,
+            Bytea: lambda v: "\\x" + hexlify(v).decode("ascii"),
+            datetime.datetime: lambda v: v.isoformat(),
+            datetime.date: lambda v: v.isoformat(),
+            datetime.time: lambda v: v.isoformat(),
+            Interval: lambda v: "%d months %d days %d microseconds" % (
+                v.months, v.days, v.microseconds),
+            Macaddr: text_type,
+            Range: range_copy_text,
+            dict: json_copy_text,
+            list: array_copy_text}
+        if not PY2:
+            self.copy_text_outs[bytes] = self.copy_text_outs[Bytea]
+
+        # Compiled Bind parameter encoders, for make_param_encoder.  Dynamic
+        # statements, such as IN lists of varying length, would otherwise
+        # add an entry each for the life of the connection.
+        self._param_encoders = pg8000.util.LRUCache(100)
         self.inspect_funcs = {
             int: inspect_int,
+            Macaddr: inspect_macaddr,
             datetime.datetime: self.inspect_datetime,
+            Range: self.range_inspect,
             list: self.array_inspect}
 
         def timestamp_send(v):
@@ -874,6 +1275,78 @@ class Connection(object):
             return self.timestamp_send(v.astimezone(utc).replace(tzinfo=None))
         self.timestamptz_send = timestamptz_send
 
+        # Int8 - Range flags (empty, bound inclusive and bound infinite).
+        # If the range isn't empty and the lower bound isn't infinite:
+        #   Int32 - Length of the lower bound.
+        #   Byte[n] - The lower bound, in the element type's binary format.
+        # If the range isn't empty and the upper bound isn't infinite:
+        #   Int32 - Length of the upper bound.
+        #   Byte[n] - The upper bound.
+        def make_range_send(send_func):
+            def range_send(v):
+                flags = v._flags
+                data = bytearray(B_pack(flags))
+                if not flags & (RANGE_EMPTY | RANGE_LB_INF):
+                    val = send_func(v.lower)
+                    data.extend(i_pack(len(val)))
+                    data.extend(val)
+                if not flags & (RANGE_EMPTY | RANGE_UB_INF):
+                    val = send_func(v.upper)
+                    data.extend(i_pack(len(val)))
+                    data.extend(val)
+                return data
+            return range_send
+
+        def jsonb_send(v):
+            # jsonb format version 1, followed by the JSON text
+            return b("\x01") + json_out(v)
+
+        ##
+        # pg type oid -> function that sends a value in the binary format of
+        # that type.  Used when the type of the destination is known, as in
+        # a binary COPY, rather than chosen from the type of the value.
+        self.pg_sends = {
+            16: bool_send,  # bool
+            17: byteasend,  # bytea
+            19: textout,  # name
+            20: q_pack,  # int8
+            21: h_pack,  # int2
+            23: i_pack,  # int4
+            25: textout,  # text
+            114: json_out,  # json
+            700: f_pack,  # float4
+            701: d_pack,  # float8
+            1042: textout,  # char
+            1043: textout,  # varchar
+            1082: date_send,  # date
+            1114: timestamp_send,  # timestamp
+            1184: timestamptz_send,  # timestamp w/ tz
+            1186: interval_send,  # interval
+            1700: numeric_send,  # numeric
+            2950: uuid_send,  # uuid
+            3802: jsonb_send,  # jsonb
+        }
+
+        ##
+        # The size in bytes of the CopyData messages sent by copy_from and
+        # copy_rows, and of the chunks of data read by copy_out_rows.  Larger
+        # chunks mean fewer messages for the server to process, at the cost
+        # of memory.
+        # <p>
+        # Stability: Added in v1.09.
+        self.copy_chunk_size = 1024 * 1024
+
+        # range oid -> send function
+        self.range_sends = {
+            3904: make_range_send(i_pack),  # int4range
+            3906: make_range_send(numeric_send),  # numrange
+            3908: make_range_send(timestamp_send),  # tsrange
+            3910: make_range_send(timestamptz_send),  # tstzrange
+            3912: make_range_send(date_send),  # daterange
+            3926: make_range_send(q_pack),  # int8range
+        }
+        self.pg_sends.update(self.range_sends)
+
         def array_recv(data, idx, length):
             final_idx = idx + length
             dim, hasnull, typeoid = iii_unpack(data, idx)
@@ -933,6 +1406,15 @@ class Connection(object):
             return datetime.time(
                 hour, minute, int(sec), int((sec - int(sec)) * 1000000))
 
+        def time_recv(data, offset, length):
+            if self._integer_datetimes:
+                # Int64 - microseconds since midnight
+                val = q_unpack(data, offset)[0]
+            else:
+                # Float8 - seconds since midnight
+                val = int(d_unpack(data, offset)[0] * 1000000)
+            return (datetime.datetime.min + timedelta(microseconds=val)).time()
+
         def timestamp_recv(data, offset, length):
             if self._integer_datetimes:
                 # data is 64-bit integer representing milliseconds since
@@ -959,12 +1441,28 @@ class Connection(object):
             else:
                 seconds, days, months = dii_unpack(data, offset)
                 microseconds = int(seconds * 1000 * 1000)
-            return Interval(microseconds, days, months)
+            return interval_unchecked(microseconds, days, months)
 
         def oid_in(data, offset, length):
             oid = data[offset: offset + length]
             return Decimal(oid) if b('.') in oid else int(oid)
 
+        def make_range_recv(recv_func):
+            def range_recv(data, offset, length):
+                flags = B_unpack(data, offset)[0] & 0x1f
+                idx = offset + 1
+                lower = upper = None
+                if not flags & (RANGE_EMPTY | RANGE_LB_INF):
+                    vlen = i_unpack(data, idx)[0]
+                    idx += 4
+                    lower = recv_func(data, idx, vlen)
+                    idx += vlen
+                if not flags & (RANGE_EMPTY | RANGE_UB_INF):
+                    vlen = i_unpack(data, idx)[0]
+                    upper = recv_func(data, idx + 4, vlen)
+                return range_unchecked(flags, lower, upper)
+            return range_recv
+
         def date_in(data, offset, length):
             return datetime.date(
                 int(data[offset:offset + 4]), int(data[offset + 5:offset + 7]),
@@ -973,6 +1471,41 @@ class Connection(object):
         def uuid_recv(data, offset, length):
             return uuid.UUID(bytes=data[offset:offset+length])
 
+        # The binary representation of json is the same as its text
+        # representation.
+        def json_recv(data, offset, length):
+            val = data[offset:offset + length]
+            if self.json_loads is None:
+                return val
+            return self.json_loads(val.decode(self._client_encoding))
+
+        # Int8 - jsonb format version, currently always 1.
+        # Byte[n] - The JSON text.
+        def jsonb_recv(data, offset, length):
+            return json_recv(data, offset + 1, length - 1)
+
+        # Int8 - Address family, 2 for IPv4 and 3 for IPv6.
+        # Int8 - Number of bits in the netmask.
+        # Int8 - 1 for cidr, 0 for inet.
+        # Int8 - Number of address bytes that follow.
+        # Byte[n] - The address, in network byte order.
+        def inet_recv(data, offset, length):
+            family, bits, is_cidr, nb = BBBB_unpack(data, offset)
+            addr = data[offset + 4:offset + 4 + nb]
+            if self.inet_as_int:
+                return int_from_bytes(addr), bits
+            elif is_cidr:
+                return ip_network((addr, bits))
+            elif bits == nb * 8:
+                return ip_address(addr)
+            else:
+                return ip_interface((addr, bits))
+
+        if ip_address is None:
+            inet_fc, inet_in = FC_TEXT, varcharin
+        else:
+            inet_fc, inet_in = FC_BINARY, inet_recv
+
         self.pg_types = defaultdict(lambda: (FC_BINARY, varcharin), {
             #16: (FC_BINARY, lambda d, o, l: d[o] == b("\x01")),  # boolean
             16: (FC_BINARY, bool_recv),  # boolean
@@ -983,9 +1516,16 @@ class Connection(object):
             23: (FC_BINARY, lambda d, o, l: i_unpack(d, o)[0]),  # int4
             25: (FC_BINARY, varcharin),  # TEXT type
             26: (FC_TEXT, oid_in),  # oid
+            114: (FC_BINARY, json_recv),  # json
+            199: (FC_BINARY, array_recv),  # JSON[]
             700: (FC_BINARY, lambda d, o, l: f_unpack(d, o)[0]),  # float4
             701: (FC_BINARY, lambda d, o, l: d_unpack(d, o)[0]),  # float8
-            829: (FC_TEXT, varcharin),  # MACADDR type
+            650: (inet_fc, inet_in),  # cidr
+            651: (FC_BINARY, array_recv),  # CIDR[]
+            774: (FC_BINARY, lambda d, o, l: Macaddr(d[o:o + l])),  # macaddr8
+            775: (FC_BINARY, array_recv),  # MACADDR8[]
+            829: (FC_BINARY, lambda d, o, l: Macaddr(d[o:o + l])),  # macaddr
+            869: (inet_fc, inet_in),  # inet
             1000: (FC_BINARY, array_recv),  # BOOL[]
             1003: (FC_BINARY, array_recv),  # NAME[]
             1005: (FC_BINARY, array_recv),  # INT2[]
@@ -996,6 +1536,8 @@ class Connection(object):
             1016: (FC_BINARY, array_recv),  # INT8[]
             1021: (FC_BINARY, array_recv),  # FLOAT4[]
             1022: (FC_BINARY, array_recv),  # FLOAT8[]
+            1040: (FC_BINARY, array_recv),  # MACADDR[]
+            1041: (FC_BINARY, array_recv),  # INET[]
             1042: (FC_BINARY, varcharin),  # CHAR type
             1043: (FC_BINARY, varcharin),  # VARCHAR type
             1082: (FC_TEXT, date_in),  # date
@@ -1008,7 +1550,36 @@ class Connection(object):
             1700: (FC_BINARY, numeric_recv),
             2275: (FC_BINARY, varcharin),  # cstring
             2950: (FC_BINARY, uuid_recv),  # uuid
+            3802: (FC_BINARY, jsonb_recv),  # jsonb
+            3807: (FC_BINARY, array_recv),  # JSONB[]
+            3904: (FC_BINARY, make_range_recv(
+                lambda d, o, l: i_unpack(d, o)[0])),  # int4range
+            3905: (FC_BINARY, array_recv),  # INT4RANGE[]
+            3906: (FC_BINARY, make_range_recv(numeric_recv)),  # numrange
+            3907: (FC_BINARY, array_recv),  # NUMRANGE[]
+            3908: (FC_BINARY, make_range_recv(timestamp_recv)),  # tsrange
+            3909: (FC_BINARY, array_recv),  # TSRANGE[]
+            3910: (FC_BINARY, make_range_recv(timestamptz_recv)),  # tstzrange
+            3911: (FC_BINARY, array_recv),  # TSTZRANGE[]
+            3912: (FC_BINARY, make_range_recv(date_recv)),  # daterange
+            3913: (FC_BINARY, array_recv),  # DATERANGE[]
+            3926: (FC_BINARY, make_range_recv(
+                lambda d, o, l: q_unpack(d, o)[0])),  # int8range
+            3927: (FC_BINARY, array_recv),  # INT8RANGE[]
         })
+
+        ##
+        # pg type oid -> binary receive function, for the types that are
+        # received in text format by queries.  Used when the server chooses
+        # the format, as in a binary COPY.
+        self.pg_binary_recvs = {
+            26: lambda d, o, l: I_unpack(d, o)[0],  # oid
+            1082: date_recv,  # date
+            1083: time_recv,  # time
+        }
+        if ip_address is not None:
+            self.pg_binary_recvs[650] = inet_recv  # cidr
+            self.pg_binary_recvs[869] = inet_recv  # inet
         self.message_types = {
             NOTICE_RESPONSE: self.handle_NOTICE_RESPONSE,
             AUTHENTICATION_REQUEST: self.handle_AUTHENTICATION_REQUEST,
@@ -1031,10 +1602,32 @@ class Connection(object):
             COPY_IN_RESPONSE: self.handle_COPY_IN_RESPONSE,
             COPY_OUT_RESPONSE: self.handle_COPY_OUT_RESPONSE}
 
+        self._unnamed_prepared_statement_lock = threading.RLock()
+        # The transaction status from the server's last ReadyForQuery.  It's
+        # only read and changed with _sock_lock held.
+        self._ready_status = "Idle"
+        self.notifies = []
+        self.notifies_lock = threading.Lock()
+
+        # Statement and portal names only need to be unique within a
+        # connection.  Taking the next value of an itertools.count is atomic,
+        # so threads using different connections don't contend on a lock.
+        self._statement_numbers = count()
+        self._portal_numbers = count()
+
+        # Close messages for finished portals, sent in front of the next
+        # statement or fetch rather than in a round trip of their own.
+        self._portal_closes = deque()
+
+    # Builds the startup message, checking the startup parameters, and sets
+    # the client encoding that the server will be asked to use.
+    def _startup_packet(
+            self, user, database, options=None, startup_params=None):
         # Int32 - Message length, including self.
         # Int32(196608) - Protocol version number.  Version 3.0.
         # Any number of key/value pairs, terminated by a zero byte:
-        #   String - A parameter name (user, database, or options)
+        #   String - A parameter name (user, database, options, or any run-time
+        #            parameter)
         #   String - Parameter value
         protocol = 196608
         val = bytearray(i_pack(protocol) + b("user\x00"))
@@ -1042,23 +1635,33 @@ class Connection(object):
         if database is not None:
             val.extend(
                 b("database\x00") + database.encode("ascii") + b("\x00"))
+
+        # Ask for UTF8 in the startup packet, rather than waiting for the
+        # server's ParameterStatus to tell us its default.
+        params = {"client_encoding": "UTF8"}
+        if options is not None:
+            params["options"] = options
+        if startup_params is not None:
+            params.update(startup_params)
+        for key in sorted(params):
+            if key in ("user", "database"):
+                raise InterfaceError(
+                    "the " + key + " startup parameter is set by its own "
+                    "argument")
+            value = text_type(params[key]).encode("utf8")
+            if b("\x00") in value:
+                raise InterfaceError(
+                    "startup parameter " + key + " contains a NUL byte")
+            val.extend(key.encode("ascii") + b("\x00") + value + b("\x00"))
         val.append(0)
-        self._write(i_pack(len(val) + 4))
-        self._write(val)
-        self._flush()
-        try:
-            self._sock_lock.acquire()
-            self.handle_messages(None)
-        finally:
-            self._sock_lock.release()
+        encoding = text_type(params["client_encoding"]).lower()
+        self._client_encoding = pg_to_py_encodings.get(encoding, encoding)
+        return val
 
-        self._begin = PreparedStatement(self, "BEGIN TRANSACTION")
-        self._commit = PreparedStatement(self, "COMMIT TRANSACTION")
-        self._rollback = PreparedStatement(self, "ROLLBACK TRANSACTION")
-        self._unnamed_prepared_statement_lock = threading.RLock()
-        self.in_transaction = False
-        self.notifies = []
-        self.notifies_lock = threading.Lock()
+    def _send_startup(self, packet):
+        self._write(i_pack(len(packet) + 4))
+        self._write(packet)
+        self._flush()
 
     def handle_ERROR_RESPONSE(self, data, ps):
         msg_dict = data_into_dict(data)
@@ -1116,26 +1719,55 @@ class Connection(object):
         is_binary, num_cols = bh_unpack(data)
         # column_formats = unpack_from('!' + 'h' * num_cols, data, 3)
         assert self._sock_lock.locked()
-        if ps.stream is None:
-            raise CopyQueryWithoutStreamError()
 
-        if PY2:
-            while True:
-                data = ps.stream.read(8192)
-                if not data:
-                    break
-                self._write(COPY_DATA + i_pack(len(data) + 4))
-                self._write(data)
-                self._flush()
-        else:
-            bffr = bytearray(8192)
-            while True:
-                bytes_read = ps.stream.readinto(bffr)
-                if bytes_read == 0:
-                    break
-                self._write(COPY_DATA + i_pack(bytes_read + 4))
-                self._write(bffr[:bytes_read])
-                self._flush()
+        # The socket's write buffer sends the data as it fills up, so the
+        # CopyData messages aren't flushed one by one.  The final flush
+        # comes with the CopyDone.
+        try:
+            if ps.stream is None:
+                raise CopyQueryWithoutStreamError()
+            elif PY2 or not hasattr(ps.stream, "read"):
+                # An iterable of chunks of data, or a file on Python 2,
+                # where file-like objects such as StringIO have no readinto.
+                # The header and then the chunk itself, which may be a
+                # memoryview of a mapped file, go to the socket's write
+                # buffer, so the data isn't copied into a message first.
+                if hasattr(ps.stream, "read"):
+                    chunks = iter(
+                        lambda: ps.stream.read(self.copy_chunk_size), b(""))
+                else:
+                    chunks = ps.stream
+                for data in chunks:
+                    self._write(COPY_DATA + i_pack(len(data) + 4))
+                    self._write(data)
+            else:
+                # Each chunk is read in after room for the message header,
+                # so that the whole CopyData message is written at once
+                # without copying the data.
+                bffr = bytearray(self.copy_chunk_size + 5)
+                bffr[:1] = COPY_DATA
+                view = memoryview(bffr)
+                data = view[5:]
+                while True:
+                    bytes_read = ps.stream.readinto(data)
+                    if not bytes_read:
+                        break
+                    i_struct.pack_into(bffr, 1, bytes_read + 4)
+                    self._write(view[:bytes_read + 5])
+        except Exception:
+            # Abort the COPY so that the connection stays usable.  The
+            # server replies with an ErrorResponse, which handle_messages
+            # reads and discards in favour of this error.
+            # Byte1('f') - Identifies the message as a CopyFail.
+            # Int32 - Message length, including self.
+            # String - The reason for the failure.
+            e = exc_info()[1]
+            self._send_messages(
+                (COPY_FAIL, bytearray(
+                    repr(e).encode("ascii", "replace") + b("\x00"))), SYNC)
+            if isinstance(e, pg8000.errors.Error):
+                raise e
+            raise DataError("error reading COPY data", e)
 
         # Send CopyDone
         # Byte1('c') - Identifier.
@@ -1179,25 +1811,26 @@ class Connection(object):
     # <p>
     # Stability: Part of the DBAPI 2.0 specification.
     def commit(self):
-        # There's a threading bug here.  If a query is sent after the
-        # commit, but before the begin, it will be executed immediately
-        # without a surrounding transaction.  Like all threading bugs -- it
-        # sounds unlikely, until it happens every time in one
-        # application...  however, to fix this, we need to lock the
-        # database connection entirely, so that no cursors can execute
-        # statements on other threads.  Support for that type of lock will
-        # be done later.
-        self._commit.execute()
-        self.in_transaction = False
+        # A statement executed by another thread after the commit begins a
+        # new transaction, since whether to begin one is decided under the
+        # socket lock when the statement is sent.  There's nothing to do if
+        # no transaction is open, though a closed connection is still an
+        # error.
+        if self._sock is None:
+            raise ConnectionClosedError()
+        if self._ready_status != "Idle":
+            self._commit.execute()
 
     ##
     # Rolls back the current database transaction.
     # <p>
     # Stability: Part of the DBAPI 2.0 specification.
     def rollback(self):
-        # see bug description in commit.
-        self._rollback.execute()
-        self.in_transaction = False
+        # see the comment in commit.
+        if self._sock is None:
+            raise ConnectionClosedError()
+        if self._ready_status != "Idle":
+            self._rollback.execute()
 
     ##
     # Closes the database connection.
@@ -1219,9 +1852,69 @@ class Connection(object):
     # <p>
     # Stability: Added in v1.00, stability guaranteed for v1.xx.
     def begin(self):
-        if not self.in_transaction and not self.autocommit:
-            self._begin.execute()
-            self.in_transaction = True
+        try:
+            self._sock_lock.acquire()
+            if self._needs_begin(None):
+                self._send_messages(*self._make_BEGIN())
+                self.handle_messages(self._begin)
+        finally:
+            self._sock_lock.release()
+
+    ##
+    # True if the connection is in a transaction block, including one that
+    # has failed and must be rolled back.
+    # <p>
+    # Stability: Added in v1.09.
+    in_transaction = property(lambda self: self._ready_status != "Idle")
+
+    ##
+    # Asks the server to cancel the statement that this connection is
+    # running.  The request is sent over a new socket, so it can be made from
+    # another thread while a query is running, and the query then fails with
+    # an error.  The server might have finished the statement already, in
+    # which case nothing happens.
+    # <p>
+    # Stability: Added in v1.09.
+    def cancel(self):
+        host, unix_sock, port, socket_timeout = self._address
+        try:
+            if unix_sock is None:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                address = (host, port)
+            else:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                address = unix_sock
+            try:
+                sock.settimeout(socket_timeout)
+                sock.connect(address)
+                # Int32(16) - Message length, including self.
+                # Int32(80877102) - The cancel request code.
+                # Int32 - The process ID of the target backend.
+                # Int32 - The secret key for the target backend.
+                sock.sendall(ii_pack(16, 80877102) + self._backend_key_data)
+                # the server closes the socket once it has passed the request
+                # on
+                sock.recv(1)
+            finally:
+                sock.close()
+        except socket.error:
+            raise InterfaceError("communication error", exc_info()[1])
+
+    ##
+    # Checks that the server is still answering, with a single Sync message
+    # that doesn't start a transaction.  Raises InterfaceError if the
+    # connection is closed or broken.
+    # <p>
+    # Stability: Added in v1.09.
+    def ping(self):
+        try:
+            self._sock_lock.acquire()
+            self._send_messages(SYNC)
+            self.handle_messages(None)
+        except (socket.error, struct_error):
+            raise InterfaceError("communication error", exc_info()[1])
+        finally:
+            self._sock_lock.release()
 
     def handle_AUTHENTICATION_REQUEST(self, data, ps):
         assert self._sock_lock.locked()
@@ -1287,6 +1980,172 @@ class Connection(object):
             # otherwise send as timestamp
             return (1114, FC_BINARY, self.timestamp_send)
 
+    ##
+    # Returns a tuple of (params, encode) for the given parameter values,
+    # where params is the list of (oid, format code, send function) tuples
+    # returned by make_params, and encode is a function returning the
+    # parameter section of a Bind message (format codes and values) for a
+    # sequence of values of the same types.  Encoders are compiled by
+    # compile_param_encoder and cached per tuple of params, so a change to
+    # py_types or inspect_funcs gives a new key rather than a stale encoder.
+    # Only the 100 most recently used encoders are kept.
+    def make_param_encoder(self, values):
+        params = self.make_params(values)
+        for value in values:
+            if type(value) is list:
+                # each array has its own send function, so there's nothing
+                # worth caching
+                return params, compile_param_encoder(params)
+        key = tuple(params)
+        try:
+            return params, self._param_encoders[key]
+        except KeyError:
+            pass
+        encoder = compile_param_encoder(params)
+        self._param_encoders[key] = encoder
+        return params, encoder
+
+    def range_inspect(self, value):
+        bound = value.upper if value.lower is None else value.lower
+        if bound is None:
+            # Empty or unbounded on both sides, so the range type can't be
+            # determined.  Send it as text and let the server work it out.
+            return (705, FC_TEXT, range_text_out)
+
+        typ = type(bound)
+        if issubclass(typ, integer_types):
+            oid = 3904  # int4range
+            for v in (value.lower, value.upper):
+                if v is not None and not (min_int4 < v < max_int4):
+                    oid = 3926  # int8range
+        elif typ is Decimal:
+            oid = 3906  # numrange
+        elif typ is datetime.datetime:
+            if bound.tzinfo is None:
+                oid = 3908  # tsrange
+            else:
+                oid = 3910  # tstzrange
+        elif typ is datetime.date:
+            oid = 3912  # daterange
+        else:
+            raise NotSupportedError(
+                "type " + str(typ) + " not supported as range bounds")
+        return (oid, FC_BINARY, self.range_sends[oid])
+
+    ##
+    # Returns a function that encodes a sequence of values as a tuple of a
+    # binary format COPY, for columns with the given type oids:
+    #
+    # Int16 - Number of fields in the tuple.
+    # For each field:
+    #   Int32 - Length of the field, or -1 for NULL.
+    #   Byte[n] - The field in binary format.
+    #
+    # Types with an entry in pg_sends, and arrays of them, are sent with that
+    # function.  For other column types, the value is sent if make_params
+    # maps it to the same type oid in binary format, otherwise
+    # NotSupportedError is raised.
+    def make_copy_row_encoder(self, oids):
+        def make_checked_send(oid):
+            def checked_send(value):
+                value_oid, fc, send_func = self.make_params((value,))[0]
+                if value_oid != oid or fc != FC_BINARY:
+                    raise NotSupportedError(
+                        "can't send " + str(type(value)) + " to a column "
+                        "of type oid " + str(oid) + " in binary")
+                return send_func(value)
+            return checked_send
+
+        def make_array_send(oid, send_func):
+            def send_array(arr):
+                if len(arr) > 0:
+                    array_check_dimensions(arr)
+                return array_send(arr, oid, send_func)
+            return send_array
+
+        params = []
+        for oid in oids:
+            if oid in self.pg_sends:
+                send_func = self.pg_sends[oid]
+            elif pg_array_elements.get(oid) in self.pg_sends:
+                element_oid = pg_array_elements[oid]
+                send_func = make_array_send(
+                    element_oid, self.pg_sends[element_oid])
+            else:
+                send_func = make_checked_send(oid)
+            params.append((oid, FC_BINARY, send_func))
+        count = len(params)
+        header = h_pack(count)
+        encode_values = compile_values_encoder(params, header)
+        sends = tuple(map(itemgetter(2), params))
+        null = i_pack(-1)
+
+        def encode_row(row):
+            if len(row) != count:
+                raise DataError(
+                    "row has " + str(len(row)) + " values, expected " +
+                    str(count))
+            if None not in row:
+                return encode_values(row)
+            data = bytearray(header)
+            for value, send_func in zip(row, sends):
+                if value is None:
+                    data.extend(null)
+                else:
+                    val = send_func(value)
+                    data.extend(i_pack(len(val)))
+                    data.extend(val)
+            return data
+        return encode_row
+
+    ##
+    # Returns a list of the binary receive functions of the given type oids,
+    # for decoding the rows of a binary COPY.
+    def make_copy_row_decoder(self, oids):
+        recv_funcs = []
+        for oid in oids:
+            fc, recv_func = self.pg_types[oid]
+            if fc != FC_BINARY:
+                try:
+                    recv_func = self.pg_binary_recvs[oid]
+                except KeyError:
+                    raise NotSupportedError(
+                        "type oid " + str(oid) + " can't be received in "
+                        "binary")
+            recv_funcs.append(recv_func)
+        return recv_funcs
+
+    ##
+    # Returns a function that encodes a row of Python values as a line of
+    # text format COPY data, with the given column separator and NULL
+    # string.  Backslashes, newlines, carriage returns and separators in the
+    # values are escaped.
+    def make_copy_text_encoder(self, sep, null):
+        escapes = {
+            ord("\\"): "\\\\", ord("\n"): "\\n",
+            ord("\r"): "\\r"}
+        escapes[ord(sep)] = "\\t" if sep == "\t" else "\\" + sep
+        # unicode.translate needs unicode replacements
+        escapes = dict((k, text_type(v)) for k, v in escapes.items())
+        sep, null = text_type(sep), text_type(null)
+        text_outs = self.copy_text_outs
+
+        def encode_row(row):
+            return sep.join([
+                null if v is None else
+                text_outs.get(type(v), text_type)(v).translate(escapes)
+                for v in row]) + "\n"
+
+        # On Python 2 some of the text outputs, such as those of isoformat
+        # and repr, are str, whose translate doesn't take a mapping.
+        def encode_row_py2(row):
+            return sep.join([
+                null if v is None else
+                text_type(text_outs.get(type(v), text_type)(v)).translate(
+                    escapes)
+                for v in row]) + "\n"
+        return encode_row_py2 if PY2 else encode_row
+
     def make_params(self, values):
         params = []
         for value in values:
@@ -1338,106 +2197,144 @@ class Connection(object):
             # rogue Sync between Bind and Execute.  Since it is quite
             # likely that data will be read from us right away anyways,
             # this seems a safe move for now.
-            self.send_EXECUTE(ps, PreparedStatement.row_cache_size)
+            #
+            # Named portals live until the end of the transaction, so several
+            # cursors can fetch from theirs in turn.  Outside a transaction
+            # block the Sync after the Execute ends the implicit transaction
+            # and drops the portal, so all the rows are fetched at once.
+            if self._ready_status == "Idle":
+                self.send_EXECUTE(ps, 0)
+            else:
+                self.send_EXECUTE(ps, PreparedStatement.row_cache_size)
 
     def parse(self, ps, statement):
         try:
             self._sock_lock.acquire()
-            statement_name = ps.statement_name.encode('ascii')
-            # Byte1('P') - Identifies the message as a Parse command.
-            # Int32 -   Message length, including self.
-            # String -  Prepared statement name. An empty string selects the
-            #           unnamed prepared statement.
-            # String -  The query string.
-            # Int16 -   Number of parameter data types specified (can be zero).
-            # For each parameter:
-            #   Int32 - The OID of the parameter data type.
-            val = bytearray(statement_name + b("\x00"))
-            val.extend(statement.encode(self._client_encoding) + b("\x00"))
-            val.extend(h_pack(len(ps.params)))
-            for oid, fc, send_func in ps.params:
-                # Parse message doesn't seem to handle the -1 type_oid for NULL
-                # values that other messages handle.  So we'll provide type_oid
-                # 705, the PG "unknown" type.
-                if oid == -1:
-                    oid = 705
-                val.extend(i_pack(oid))
-
-            # Byte1('D') - Identifies the message as a describe command.
-            # Int32 - Message length, including self.
-            # Byte1 - 'S' for prepared statement, 'P' for portal.
-            # String - The name of the item to describe.
-            desc_data = bytearray(b("S") + statement_name + b('\x00'))
-            self._send_messages(
-                (PARSE, val), (DESCRIBE, desc_data), SYNC, FLUSH)
+            self._send_messages(*self._make_PARSE(ps, statement))
             self.handle_messages(ps)
         finally:
             self._sock_lock.release()
 
+    def _make_PARSE(self, ps, statement):
+        statement_name = ps.statement_name.encode('ascii')
+        # Byte1('P') - Identifies the message as a Parse command.
+        # Int32 -   Message length, including self.
+        # String -  Prepared statement name. An empty string selects the
+        #           unnamed prepared statement.
+        # String -  The query string.
+        # Int16 -   Number of parameter data types specified (can be zero).
+        # For each parameter:
+        #   Int32 - The OID of the parameter data type.
+        val = bytearray(statement_name + b("\x00"))
+        val.extend(statement.encode(self._client_encoding) + b("\x00"))
+        val.extend(h_pack(len(ps.params)))
+        for oid, fc, send_func in ps.params:
+            # Parse message doesn't seem to handle the -1 type_oid for NULL
+            # values that other messages handle.  So we'll provide type_oid
+            # 705, the PG "unknown" type.
+            if oid == -1:
+                oid = 705
+            val.extend(i_pack(oid))
+
+        # Byte1('D') - Identifies the message as a describe command.
+        # Int32 - Message length, including self.
+        # Byte1 - 'S' for prepared statement, 'P' for portal.
+        # String - The name of the item to describe.
+        desc_data = bytearray(b("S") + statement_name + b('\x00'))
+        return (PARSE, val), (DESCRIBE, desc_data), SYNC, FLUSH
+
     def bind(self, ps, values):
         try:
             self._sock_lock.acquire()
-            self.binding = True
-            if ps.statement_row_desc is None:
-                # no data going out
-                output_fc = ()
+            if self._needs_begin(ps):
+                # BEGIN is sent in the same write as the statement, and its
+                # response is read first.  The binding flag is only set for
+                # the statement, so that an error sends the SYNC it needs.
+                self._send_messages(*(
+                    self._make_BEGIN() + self._take_portal_closes() +
+                    self._make_BIND(ps, values)))
+                self.binding = False
+                try:
+                    self.handle_messages(self._begin)
+                finally:
+                    self.binding = True
+                    self.handle_messages(ps)
             else:
-                # We've got row_desc that allows us to identify what we're
-                # going to get back from this statement.
-                output_fc = tuple(
-                    self.pg_types[f['type_oid']][0] for f in
-                    ps.statement_row_desc)
-
-            statement_name_bin = ps.statement_name.encode('ascii')
-            portal_name_bin = ps.portal_name.encode('ascii')
-
-            # Byte1('B') - Identifies the Bind command.
-            # Int32 - Message length, including self.
-            # String - Name of the destination portal.
-            # String - Name of the source prepared statement.
-            # Int16 - Number of parameter format codes.
-            # For each parameter format code:
-            #   Int16 - The parameter format code.
-            # Int16 - Number of parameter values.
-            # For each parameter value:
-            #   Int32 - The length of the parameter value, in bytes, not
-            #           including this length.  -1 indicates a NULL parameter
-            #           value, in which no value bytes follow.
-            #   Byte[n] - Value of the parameter.
-            # Int16 - The number of result-column format codes.
-            # For each result-column format code:
-            #   Int16 - The format code.
-            retval = bytearray(portal_name_bin + b("\x00"))
-            retval.extend(statement_name_bin + b("\x00"))
-            retval.extend(h_pack(len(ps.params)))
-            retval.extend(
-                pack(
-                    "!" + "h" * len(ps.params),
-                    *tuple(map(itemgetter(1), ps.params))))
-            retval.extend(h_pack(len(ps.params)))
-            for value, (oid, fc, send_func) in zip(values, ps.params):
-                val = send_func(value)
-                if oid != -1:
-                    retval.extend(i_pack(len(val)))
-                retval.extend(val)
-            retval.extend(h_pack(len(output_fc)))
-            retval.extend(pack("!" + "h" * len(output_fc), *output_fc))
-
-            # We need to describe the portal after bind, since the return
-            # format codes will be different (hopefully, always what we
-            # requested).
-
-            # Byte1('D') - Identifies the message as a describe command.
-            # Int32 - Message length, including self.
-            # Byte1 - 'S' for prepared statement, 'P' for portal.
-            # String - The name of the item.
-            val = bytearray(b('P') + portal_name_bin + b('\x00'))
-            assert self._sock_lock.locked()
-            self._send_messages((BIND, retval), (DESCRIBE, val), FLUSH)
-            self.handle_messages(ps)
+                self.binding = True
+                self._send_messages(*(
+                    self._take_portal_closes() + self._make_BIND(ps, values)))
+                self.handle_messages(ps)
         finally:
             self._sock_lock.release()
 
+    # Whether a transaction must be begun before executing the statement.
+    # Called with _sock_lock held, so that the decision is made on the
+    # server's current transaction status, whichever thread changed it.
+    def _needs_begin(self, ps):
+        return not self.autocommit and self._ready_status == "Idle" and \
+            ps is not self._commit and ps is not self._rollback
+
+    # The messages that begin a transaction, sent in front of the first
+    # statement of the transaction.  BEGIN is executed from its prepared
+    # statement through the unnamed portal, rather than as a simple query,
+    # since a simple query would destroy the unnamed prepared statement that
+    # has just been parsed for the statement.
+    def _make_BEGIN(self):
+        # Bind: the unnamed portal, the statement, no parameter format codes,
+        # no parameter values and no result-column format codes.
+        bind = bytearray(
+            b("\x00") + self._begin.statement_name.encode('ascii') +
+            b("\x00") + h_pack(0) + h_pack(0) + h_pack(0))
+        # Execute: the unnamed portal, with no limit on the rows returned.
+        return (BIND, bind), (EXECUTE, b("\x00") + i_pack(0)), SYNC
+
+    def _make_BIND(self, ps, values):
+        if ps.statement_row_desc is None:
+            # no data going out
+            output_fc = ()
+        else:
+            # We've got row_desc that allows us to identify what we're
+            # going to get back from this statement.
+            output_fc = tuple(
+                self.pg_types[f['type_oid']][0] for f in
+                ps.statement_row_desc)
+
+        statement_name_bin = ps.statement_name.encode('ascii')
+        portal_name_bin = ps.portal_name.encode('ascii')
+
+        # Byte1('B') - Identifies the Bind command.
+        # Int32 - Message length, including self.
+        # String - Name of the destination portal.
+        # String - Name of the source prepared statement.
+        # Int16 - Number of parameter format codes.
+        # For each parameter format code:
+        #   Int16 - The parameter format code.
+        # Int16 - Number of parameter values.
+        # For each parameter value:
+        #   Int32 - The length of the parameter value, in bytes, not
+        #           including this length.  -1 indicates a NULL parameter
+        #           value, in which no value bytes follow.
+        #   Byte[n] - Value of the parameter.
+        # Int16 - The number of result-column format codes.
+        # For each result-column format code:
+        #   Int16 - The format code.
+        retval = bytearray(portal_name_bin + b("\x00"))
+        retval.extend(statement_name_bin + b("\x00"))
+        retval.extend(ps.encode_params(values))
+        retval.extend(h_pack(len(output_fc)))
+        retval.extend(pack("!" + "h" * len(output_fc), *output_fc))
+
+        # We need to describe the portal after bind, since the return
+        # format codes will be different (hopefully, always what we
+        # requested).
+
+        # Byte1('D') - Identifies the message as a describe command.
+        # Int32 - Message length, including self.
+        # Byte1 - 'S' for prepared statement, 'P' for portal.
+        # String - The name of the item.
+        val = bytearray(b('P') + portal_name_bin + b('\x00'))
+        return (BIND, retval), (DESCRIBE, val), FLUSH
+
     def _send_messages(self, *messages):
         try:
 
@@ -1468,7 +2365,8 @@ class Connection(object):
         ps.portal_suspended = False
         portal_name_b = ps.portal_name.encode('ascii')
         val = portal_name_b + b('\x00') + i_pack(row_count)
-        self._send_messages((EXECUTE, val), SYNC, FLUSH)
+        self._send_messages(
+            *(self._take_portal_closes() + ((EXECUTE, val), SYNC, FLUSH)))
 
     def handle_NO_DATA(self, msg, ps):
         assert self._sock_lock.locked()
@@ -1518,10 +2416,18 @@ class Connection(object):
         message_code = None
         error = None
         while message_code != READY_FOR_QUERY:
-            message_code, data_len = ci_unpack(self._sock.read(5))
             try:
-                self.message_types[message_code](
-                    self._sock.read(data_len - 4), prepared_statement)
+                message_code, data_len = ci_unpack(self._sock.read(5))
+                data = self._sock.read(data_len - 4)
+            except socket.timeout:
+                # Part of a message may have been read, so the connection
+                # can't be used any more.
+                self._sock.close()
+                self._sock = None
+                raise InterfaceError(
+                    "timed out waiting for the server", exc_info()[1])
+            try:
+                self.message_types[message_code](data, prepared_statement)
             except KeyError:
                 raise InternalError(
                     "Unrecognised message code " + message_code)
@@ -1529,7 +2435,8 @@ class Connection(object):
                 e = exc_info()[1]
                 if prepared_statement is None:
                     raise e
-                else:
+                elif error is None:
+                    # later errors are usually a consequence of the first
                     error = e
         if error is not None:
             raise error
@@ -1543,7 +2450,8 @@ class Connection(object):
             bytearray(typ + ps.statement_name.encode("ascii") + b("\x00"))
 
     def _make_CLOSE_portal(self, ps):
-        return self._make_CLOSE(b("P"), ps)
+        return CLOSE, \
+            bytearray(b("P") + ps.portal_name.encode("ascii") + b("\x00"))
 
     def close_statement(self, ps):
         try:
@@ -1553,13 +2461,21 @@ class Connection(object):
         finally:
             self._sock_lock.release()
 
+    # The portal is closed by the server along with the next statement or
+    # fetch on this connection, so closing it doesn't need _sock_lock or a
+    # round trip.  Appending to a deque is atomic.
     def close_portal(self, ps):
-        try:
-            self._sock_lock.acquire()
-            self._send_messages(self._make_CLOSE_portal(ps), SYNC)
-            self.handle_messages(ps)
-        finally:
-            self._sock_lock.release()
+        if ps.portal_name is not None:
+            self._portal_closes.append(self._make_CLOSE_portal(ps))
+            ps.portal_name = None
+
+    # Called with _sock_lock held.  Closing a portal that no longer exists,
+    # for example because its transaction has ended, isn't an error.
+    def _take_portal_closes(self):
+        closes = ()
+        while len(self._portal_closes) > 0:
+            closes += (self._portal_closes.popleft(),)
+        return closes
 
     def handle_NOTICE_RESPONSE(self, data, ps):
         resp = data_into_dict(data)
@@ -1568,6 +2484,7 @@ class Connection(object):
     def handle_PARAMETER_STATUS(self, data, ps):
         pos = data.find(b("\x00"))
         key, value = data[:pos], data[pos + 1:-1]
+        self._parameter_statuses[key] = value
         if key == b("client_encoding"):
             encoding = value.decode("ascii").lower()
             self._client_encoding = pg_to_py_encodings.get(encoding, encoding)
@@ -1636,19 +2553,7 @@ class Connection(object):
             # check that all array dimensions are consistent
             array_check_dimensions(value)
 
-            has_null = array_has_null(arr)
-            dim_lengths = array_dim_lengths(arr)
-            data = bytearray(iii_pack(len(dim_lengths), has_null, oid))
-            for i in dim_lengths:
-                data.extend(ii_pack(i, 1))
-            for v in array_flatten(arr):
-                if v is None:
-                    data += i_pack(-1)
-                else:
-                    inner_data = send_func(v)
-                    data += i_pack(len(inner_data))
-                    data += inner_data
-            return data
+            return array_send(arr, oid, send_func)
         return (array_typeoid, FC_BINARY, send_array)
 
 
@@ -1662,7 +2567,8 @@ class Connection(object):
 #
 # @keyparam host   The hostname of the PostgreSQL server to connect with.
 # Providing this parameter is necessary for TCP/IP connections.  One of either
-# host, or unix_sock, must be provided.
+# host, or unix_sock, must be provided.  From v1.09, it may also be a list of
+# hostnames or (hostname, port) tuples, which are tried in turn.
 #
 # @keyparam unix_sock   The path to the UNIX socket to access the database
 # through, for example, '/tmp/.s.PGSQL.5432'.  One of either unix_sock or host
@@ -1688,12 +2594,224 @@ class Connection(object):
 #
 # @keyparam ssl     Use SSL encryption for TCP/IP socket.  Defaults to False.
 #
+# @keyparam options   Command-line options for the server process, sent as the
+# options startup parameter, for example '-c geqo=off'.  Spaces within a value
+# must be escaped with a backslash.  Optional.  Added in v1.09.
+#
+# @keyparam startup_params   A dict of run-time parameters, such as
+# application_name, search_path or statement_timeout, that are sent in the
+# startup packet.  They take effect as the session starts, saving a round trip
+# for each SET statement.  client_encoding defaults to UTF8.  Optional.  Added
+# in v1.09.
+#
+# @keyparam target_session_attrs   The kind of server wanted: 'any' (the
+# default), 'read-write', 'read-only', 'primary', 'standby' or
+# 'prefer-standby', which picks a standby if one can be reached, and otherwise
+# any server.  Servers that don't match are disconnected from.  Added in v1.09.
+#
+# @keyparam stagger_delay   When host is a list, the number of seconds to wait
+# for a server to answer before also trying the next host in the list.
+# Defaults to 0.5 seconds.  Added in v1.09.
+#
 # @return An instance of {@link #ConnectionWrapper ConnectionWrapper}.
 def connect(
         user, host='localhost', unix_sock=None, port=5432, database=None,
-        password=None, socket_timeout=60, ssl=False):
-    return Connection(
-        user, host, unix_sock, port, database, password, socket_timeout, ssl)
+        password=None, socket_timeout=60, ssl=False, options=None,
+        startup_params=None, target_session_attrs='any', stagger_delay=0.5):
+    if target_session_attrs not in session_matchers:
+        raise InterfaceError(
+            "unknown target_session_attrs " + repr(target_session_attrs))
+
+    def make(address):
+        return Connection(
+            user, address[0], unix_sock, address[1], database, password,
+            socket_timeout, ssl, options, startup_params)
+
+    if isinstance(host, (list, tuple)) and unix_sock is None:
+        addresses = []
+        for h in host:
+            if isinstance(h, tuple):
+                addresses.append(h)
+            else:
+                addresses.append((h, port))
+        return connect_hosts(
+            addresses, target_session_attrs, stagger_delay, make)
+    elif target_session_attrs != 'any':
+        return connect_hosts(
+            [(host, port)], target_session_attrs, stagger_delay, make)
+    else:
+        return make((host, port))
+
+
+##
+# The number of seconds for which the result of connecting to a host is
+# remembered by {@link #connect connect} when it's given a list of hosts.
+# Hosts that couldn't be reached, or that didn't match target_session_attrs,
+# are tried after the others until then.
+# <p>
+# Stability: Added in v1.09.
+host_status_ttl = 10
+
+# (host, port) -> (expiry time, role), where role is None for a host that
+# couldn't be reached, () for one whose role wasn't asked for, and otherwise
+# an (in recovery, read only) tuple
+host_statuses = {}
+host_statuses_lock = threading.Lock()
+
+
+# Returns (in recovery, read only) for a new connection.  Servers since 14
+# report in_hot_standby and default_transaction_read_only when the
+# connection starts, and older ones are asked.
+def session_role(conn):
+    params = conn._parameter_statuses
+    if b("in_hot_standby") in params and \
+            b("default_transaction_read_only") in params:
+        in_recovery = params[b("in_hot_standby")] == b("on")
+        read_only = params[b("default_transaction_read_only")] == b("on")
+        return in_recovery, in_recovery or read_only
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT pg_is_in_recovery(), "
+            "current_setting('transaction_read_only') = 'on'")
+        in_recovery, read_only = cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.rollback()
+    return in_recovery, read_only
+
+
+# target_session_attrs -> function of (in recovery, read only) that says
+# whether a server is wanted.  prefer-standby falls back to any server.
+session_matchers = {
+    'any': lambda role: True,
+    'read-write': lambda role: not role[1],
+    'read-only': lambda role: role[1],
+    'primary': lambda role: not role[0],
+    'standby': lambda role: role[0],
+    'prefer-standby': lambda role: role[0]}
+
+
+# Opens connections to the addresses in turn, starting the next attempt after
+# stagger_delay seconds, or as soon as the last one fails.  The first server
+# that matches target_session_attrs is returned, and the other connections
+# are closed.
+def connect_hosts(addresses, target_session_attrs, stagger_delay, make):
+    matches = session_matchers[target_session_attrs]
+    now = time.time()
+
+    def priority(address):
+        try:
+            host_statuses_lock.acquire()
+            expiry, role = host_statuses.get(address, (0, ()))
+        finally:
+            host_statuses_lock.release()
+        if expiry < now or role == ():
+            return 1
+        elif role is None:
+            return 3
+        elif matches(role):
+            return 0
+        else:
+            return 2
+
+    # sorted() is stable, so the hosts otherwise keep their order
+    waiting = deque(sorted(addresses, key=priority))
+    results = queue.Queue()
+    lock = threading.Lock()
+    state = {'done': False}
+
+    def attempt(address):
+        try:
+            conn = make(address)
+            try:
+                # every server will do for 'any', so none is asked its role
+                if target_session_attrs == 'any':
+                    result = address, conn, ()
+                else:
+                    result = address, conn, session_role(conn)
+            except Exception:
+                conn.close()
+                raise
+        except Exception:
+            result = address, None, exc_info()[1]
+        try:
+            lock.acquire()
+            if not state['done']:
+                results.put(result)
+                return
+        finally:
+            lock.release()
+        if result[1] is not None:
+            result[1].close()
+
+    def start_next():
+        t = threading.Thread(target=attempt, args=(waiting.popleft(),))
+        t.daemon = True
+        t.start()
+
+    running = 0
+    chosen = fallback = None
+    errors = []
+    try:
+        while waiting or running > 0:
+            if running == 0:
+                start_next()
+                running += 1
+            try:
+                if waiting:
+                    address, conn, role = results.get(timeout=stagger_delay)
+                else:
+                    address, conn, role = results.get()
+            except queue.Empty:
+                start_next()
+                running += 1
+                continue
+            running -= 1
+
+            if conn is None:
+                errors.append(role)
+                role = None
+            try:
+                host_statuses_lock.acquire()
+                host_statuses[address] = (time.time() + host_status_ttl, role)
+            finally:
+                host_statuses_lock.release()
+            if conn is None:
+                continue
+            elif matches(role):
+                chosen = conn
+                break
+            elif target_session_attrs == 'prefer-standby' and \
+                    fallback is None:
+                fallback = conn
+            else:
+                conn.close()
+    finally:
+        try:
+            lock.acquire()
+            state['done'] = True
+        finally:
+            lock.release()
+        while not results.empty():
+            conn = results.get()[1]
+            if conn is not None:
+                conn.close()
+        if chosen is not None and fallback is not None:
+            fallback.close()
+
+    if chosen is None:
+        chosen = fallback
+    if chosen is not None:
+        return chosen
+    elif len(addresses) == 1 and len(errors) == 1:
+        raise errors[0]
+    elif len(errors) == len(addresses):
+        raise InterfaceError("could not connect to any host", errors)
+    else:
+        raise InterfaceError(
+            "no host matches target_session_attrs " + target_session_attrs,
+            errors)
 
 
 try:
@@ -1719,7 +2837,43 @@ pg_array_types = {
     701: 1022,
     16: 1000,
     25: 1009,      # TEXT[]
+    114: 199,      # JSON[]
+    650: 651,      # CIDR[]
+    774: 775,      # MACADDR8[]
+    829: 1040,     # MACADDR[]
+    869: 1041,     # INET[]
     1700: 1231,  # NUMERIC[]
+    3904: 3905,  # INT4RANGE[]
+    3906: 3907,  # NUMRANGE[]
+    3908: 3909,  # TSRANGE[]
+    3910: 3911,  # TSTZRANGE[]
+    3912: 3913,  # DATERANGE[]
+    3926: 3927,  # INT8RANGE[]
+}
+
+
+# pg array typeoid -> pg element typeoid, for sending arrays to columns of a
+# known type
+pg_array_elements = {
+    1000: 16,  # BOOL[]
+    1001: 17,  # BYTEA[]
+    1003: 19,  # NAME[]
+    1005: 21,  # INT2[]
+    1007: 23,  # INT4[]
+    1009: 25,  # TEXT[]
+    1014: 1042,  # CHAR[]
+    1015: 1043,  # VARCHAR[]
+    1016: 20,  # INT8[]
+    1021: 700,  # FLOAT4[]
+    1022: 701,  # FLOAT8[]
+    1115: 1114,  # TIMESTAMP[]
+    1182: 1082,  # DATE[]
+    1185: 1184,  # TIMESTAMPTZ[]
+    1187: 1186,  # INTERVAL[]
+    1231: 1700,  # NUMERIC[]
+    2951: 2950,  # UUID[]
+    199: 114,  # JSON[]
+    3807: 3802,  # JSONB[]
 }
 
 
@@ -1727,10 +2881,572 @@ def byteasend(v):
     return v
 
 
+# date is sent and received in binary as an Int32 number of days since
+# 2000-01-01, with the largest and smallest values meaning infinity.
+DATE_OFFSET = datetime.date(2000, 1, 1).toordinal()
+DATE_INFINITY = 2 ** 31 - 1
+DATE_NEG_INFINITY = -2 ** 31
+
+
+def date_send(v):
+    return i_pack(v.toordinal() - DATE_OFFSET)
+
+
+def date_recv(data, offset, length):
+    days = i_unpack(data, offset)[0]
+    if days == DATE_INFINITY:
+        return datetime.date.max
+    elif days == DATE_NEG_INFINITY:
+        return datetime.date.min
+    return datetime.date.fromordinal(days + DATE_OFFSET)
+
+
+def range_text_out(v):
+    if v.is_empty:
+        return b("empty")
+    return b("(,)")
+
+
+def bool_send(v):
+    return b("\x01") if v else b("\x00")
+
+
+def uuid_send(v):
+    return v.bytes
+
+
+# Byte11 - Signature, "PGCOPY\n\377\r\n\0".
+# Int32 - Flags field, no flags are used.
+# Int32 - Length of the header extension area, always zero.
+BINARY_COPY_HEADER = b("PGCOPY\n\xff\r\n\x00") + ii_pack(0, 0)
+
+# Int16(-1) - File trailer.
+BINARY_COPY_TRAILER = h_pack(-1)
+
+
+# file extension -> compression
+COMPRESSION_EXTENSIONS = {
+    ".gz": "gzip",
+    ".bz2": "bz2",
+    ".xz": "xz",
+    ".lzma": "lzma",
+}
+
+
+def compression_from_path(path):
+    return COMPRESSION_EXTENSIONS.get(path[path.rfind("."):].lower())
+
+
+def make_compressor(compression):
+    if compression == "gzip":
+        import zlib
+        return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif compression == "bz2":
+        import bz2
+        return bz2.BZ2Compressor()
+    elif compression in ("xz", "lzma"):
+        import lzma
+        return lzma.LZMACompressor(
+            lzma.FORMAT_XZ if compression == "xz" else lzma.FORMAT_ALONE)
+    raise NotSupportedError("compression " + str(compression))
+
+
+def make_decompressor(compression):
+    if compression == "gzip":
+        import zlib
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif compression == "bz2":
+        import bz2
+        return bz2.BZ2Decompressor()
+    elif compression in ("xz", "lzma"):
+        import lzma
+        return lzma.LZMADecompressor()
+    raise NotSupportedError("compression " + str(compression))
+
+
+##
+# A generator of the decompressed data of a compressed file object.  Files
+# of several compressed streams one after the other, as made by
+# concatenating gzip files, are decompressed in full.  Each chunk is at most
+# chunk_size bytes, however well the data compresses, so that the queue of
+# chunks bounds the memory used.  Python 2's bz2 module can't limit its
+# output, so there a chunk is all the data decompressed from one read.
+def decompress_chunks(fileobj, compression, chunk_size):
+    decompressor = make_decompressor(compression)
+    data = b("")
+    fed = False
+    # whether the decompressor may have more output without more input
+    pending = False
+    while True:
+        if len(data) == 0 and not pending:
+            data = fileobj.read(chunk_size)
+            if not data:
+                break
+        fed = True
+        if hasattr(decompressor, "unconsumed_tail"):
+            # zlib leaves the input it had no room to decompress in
+            # unconsumed_tail
+            chunk = decompressor.decompress(data, chunk_size)
+            data = decompressor.unconsumed_tail
+            pending = len(chunk) == chunk_size
+        elif hasattr(decompressor, "needs_input"):
+            # bz2 and lzma keep the input they had no room to decompress,
+            # and are given an empty string until they need more
+            chunk = decompressor.decompress(data, chunk_size)
+            data = b("")
+            pending = not decompressor.needs_input
+        else:
+            chunk = decompressor.decompress(data)
+            data = b("")
+        if chunk:
+            yield chunk
+        if getattr(decompressor, "eof", False):
+            data = decompressor.unused_data
+            decompressor = make_decompressor(compression)
+            fed = False
+            pending = False
+    if fed and not getattr(decompressor, "eof", True):
+        raise DataError("compressed COPY data is truncated")
+
+
+##
+# A generator of windows of a memory map of a file, each chunk_size bytes long
+# (apart from the last one).  Each window is released once the next one is
+# asked for, so that the map can be closed at the end.
+def mmap_chunks(f, chunk_size):
+    size = os.fstat(f.fileno()).st_size
+    if size == 0:
+        # an empty file can't be mapped
+        return
+    m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if hasattr(m, "madvise"):
+            m.madvise(mmap.MADV_SEQUENTIAL)
+        if PY2:
+            for i in range(0, size, chunk_size):
+                yield m[i:i + chunk_size]
+        else:
+            view = memoryview(m)
+            try:
+                for i in range(0, size, chunk_size):
+                    chunk = view[i:i + chunk_size]
+                    try:
+                        yield chunk
+                    finally:
+                        chunk.release()
+            finally:
+                view.release()
+    finally:
+        m.close()
+
+
+##
+# Compresses the chunks put on a queue by a CopyOutBuffer and writes them to
+# a file object, until the None that marks the end of the data.  Runs in a
+# background thread; an error is put in errors, and the rest of the chunks
+# are discarded so that the COPY can finish.
+def compress_chunks(chunks, compressor, fileobj, errors):
+    while True:
+        chunk = chunks.get()
+        if len(errors) > 0:
+            if chunk is None:
+                return
+            continue
+        try:
+            if chunk is None:
+                fileobj.write(compressor.flush())
+                return
+            fileobj.write(compressor.compress(chunk))
+        except Exception:
+            errors.append(exc_info()[1])
+
+
+##
+# Returns a generator of the items of an iterable, which is read by a
+# background thread up to size items ahead.  If the generator is closed
+# early the thread stops reading.
+def read_ahead(iterable, size):
+    items = queue.Queue(size)
+    stop = threading.Event()
+    errors = []
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except Exception:
+            errors.append(exc_info()[1])
+        finally:
+            put(None)
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    return iterate_read_ahead(items, stop, thread, errors)
+
+
+def iterate_read_ahead(items, stop, thread, errors):
+    try:
+        while True:
+            item = items.get()
+            if item is None:
+                break
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+    if len(errors) > 0:
+        raise errors[0]
+
+
+##
+# A generator of the data of a text format COPY for the given rows, in chunks
+# of at least chunk_size bytes (apart from the last one).  Each row is
+# encoded with encode_row, as returned by Connection.make_copy_text_encoder,
+# and each chunk is encoded to bytes in one go.
+def text_copy_data(encode_row, rows, chunk_size, encoding):
+    lines = []
+    size = 0
+    for row in rows:
+        line = encode_row(row)
+        lines.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield "".join(lines).encode(encoding)
+            lines = []
+            size = 0
+    if len(lines) > 0:
+        yield "".join(lines).encode(encoding)
+
+
+##
+# A generator of the data of a binary format COPY for the given rows, in
+# chunks of at least chunk_size bytes (apart from the last one).  Each row is
+# encoded with encode_row, as returned by Connection.make_copy_row_encoder.
+def binary_copy_data(encode_row, rows, chunk_size):
+    data = bytearray(BINARY_COPY_HEADER)
+    for row in rows:
+        data.extend(encode_row(row))
+        if len(data) >= chunk_size:
+            yield data
+            data = bytearray()
+    data.extend(BINARY_COPY_TRAILER)
+    yield data
+
+
+# The number of chunks of COPY data that CopyOutIterator reads ahead.
+COPY_OUT_QUEUE_SIZE = 4
+
+
+##
+# A stream for handle_COPY_DATA that gathers the COPY data into batches of at
+# least chunk_size bytes and puts them on a queue.  If join is true a batch is
+# a single byte string, otherwise it's the list of the data of each CopyData
+# message.
+class CopyOutBuffer(object):
+    def __init__(self, chunks, chunk_size, join=True):
+        self.chunks = chunks
+        self.chunk_size = chunk_size
+        self.join = join
+        self.data = []
+        self.size = 0
+
+    def write(self, data):
+        self.data.append(data)
+        self.size += len(data)
+        if self.size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.data) > 0:
+            if self.join:
+                self.chunks.put(b("").join(self.data))
+            else:
+                self.chunks.put(self.data)
+            self.data = []
+            self.size = 0
+
+
+##
+# An iterator of the data of a COPY ... TO STDOUT query, run by a background
+# thread that puts the data on a queue through a CopyOutBuffer.  The thread
+# is only started by the first call to next(), so an iterator that's never
+# used holds nothing.  Any error raised by the COPY is raised once all the
+# data has been read.
+# <p>
+# The iterator owns the thread, rather than leaving a generator's finally
+# clause to stop it, so that close() finishes the COPY at once whichever
+# Python implementation is running.  decode, if given, is a function
+# returning an iterator of the items to return, from an iterator of the
+# chunks.
+class CopyOutIterator(Iterator):
+    def __init__(self, cursor, query, join=True, decode=None):
+        self._cursor = cursor
+        self._query = query
+        self._join = join
+        self._chunks = None
+        self._thread = None
+        self._errors = []
+        self._finished = False
+        self._items = self._read_chunks()
+        if decode is not None:
+            self._items = decode(self._items)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._items)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    ##
+    # Reads and discards the rest of the data, so that the connection can be
+    # used again.  Errors raised by the COPY are discarded too.
+    def close(self):
+        if self._thread is not None and not self._finished:
+            while self._chunks.get() is not None:
+                pass
+            self._thread.join()
+        self._finished = True
+        self._items = iter(())
+
+    def _read_chunks(self):
+        while True:
+            chunk = self._next_chunk()
+            if chunk is None:
+                return
+            yield chunk
+
+    def _next_chunk(self):
+        if self._finished:
+            return None
+        if self._thread is None:
+            self._chunks = queue.Queue(COPY_OUT_QUEUE_SIZE)
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        chunk = self._chunks.get()
+        if chunk is None:
+            self._thread.join()
+            self._finished = True
+            if len(self._errors) > 0:
+                raise self._errors[0]
+        return chunk
+
+    def _run(self):
+        stream = CopyOutBuffer(
+            self._chunks, self._cursor._conn.copy_chunk_size, self._join)
+        try:
+            self._cursor.execute(self._query, stream=stream)
+            stream.flush()
+        except Exception:
+            self._errors.append(exc_info()[1])
+        finally:
+            self._chunks.put(None)
+
+
+##
+# A generator of the rows of a binary format COPY, decoded from an iterable
+# of chunks of its data.  Rows may be split across chunks.  recv_funcs holds
+# the receive function of each column, as returned by
+# Connection.make_copy_row_decoder.
+def binary_copy_rows(recv_funcs, chunks):
+    num_cols = len(recv_funcs)
+    data = b("")
+    idx = 0
+    in_header = True
+    finished = False
+    for chunk in chunks:
+        if finished:
+            continue
+        if idx < len(data):
+            data = data[idx:] + chunk
+        else:
+            data = chunk
+        idx = 0
+        end = len(data)
+
+        if in_header:
+            if end < 19:
+                continue
+            if data[:11] != BINARY_COPY_HEADER[:11]:
+                raise DataError("invalid binary COPY signature")
+            idx = 19 + ii_unpack(data, 11)[1]
+            if idx > end:
+                idx = 0
+                continue
+            in_header = False
+
+        # Int16 - Number of fields in the tuple, or -1 for the trailer.
+        # For each field:
+        #   Int32 - Length of the field, or -1 for NULL.
+        #   Byte[n] - The value of the field.
+        while end - idx >= 2:
+            field_count = h_unpack(data, idx)[0]
+            if field_count == -1:
+                finished = True
+                break
+            elif field_count != num_cols:
+                raise DataError(
+                    "expected " + str(num_cols) + " fields in COPY row, got " +
+                    str(field_count))
+            row = []
+            pos = idx + 2
+            for recv_func in recv_funcs:
+                if end - pos < 4:
+                    break
+                vlen = i_unpack(data, pos)[0]
+                pos += 4
+                if vlen == -1:
+                    row.append(None)
+                elif end - pos < vlen:
+                    break
+                else:
+                    row.append(recv_func(data, pos, vlen))
+                    pos += vlen
+            else:
+                idx = pos
+                yield row
+                continue
+            # the rest of the row is in the next chunk
+            break
+    if not finished:
+        raise DataError("binary COPY data ended without a trailer")
+
+
+# send function -> (struct format code, length) for the types that
+# compile_values_encoder can pack directly
+FIXED_WIDTH_SENDS = {
+    bool_send: ("?", 1),
+    h_pack: ("h", 2),
+    i_pack: ("i", 4),
+    q_pack: ("q", 8),
+    f_pack: ("f", 4),
+    d_pack: ("d", 8),
+}
+
+
+##
+# Compiles a function that encodes the parameter section of a Bind message
+# for the given list of (oid, format code, send function) tuples.  The
+# function takes a sequence of parameter values and returns:
+#
+# Int16 - Number of parameter format codes.
+# For each parameter format code:
+#   Int16 - The parameter format code.
+# Int16 - Number of parameter values.
+# For each parameter value:
+#   Int32 - The length of the parameter value, in bytes, not including this
+#           length.  -1 indicates a NULL parameter value, in which no value
+#           bytes follow.
+#   Byte[n] - Value of the parameter.
+def compile_param_encoder(params):
+    count = len(params)
+    return compile_values_encoder(
+        params, h_pack(count) +
+        pack("!" + "h" * count, *tuple(map(itemgetter(1), params))) +
+        h_pack(count))
+
+
+##
+# Compiles a function that encodes a sequence of values as the given header
+# followed by an Int32 length and the bytes of each value, using the send
+# functions of the given list of (oid, format code, send function) tuples.
+# An oid of -1 means the value is always NULL, which is encoded as a length of
+# -1 with no bytes.
+#
+# Each run of NULLs and fixed-width values (bool, int2, int4, int8, float4 and
+# float8) is written with a single struct pack call, including the lengths.
+def compile_values_encoder(params, header):
+    namespace = {
+        "header": header,
+        "i_pack": i_pack,
+        # str.join doesn't take the bytearrays of send functions such as
+        # array_send on Python 2, but bytearray.join takes both
+        "empty": bytearray() if PY2 else b("")}
+    lines = []
+    parts = ["header"]
+    fmt = []
+    args = []
+
+    def end_run():
+        if fmt:
+            name = "pack_%d" % len(parts)
+            namespace[name] = Struct("!" + "".join(fmt)).pack
+            parts.append("%s(%s)" % (name, ", ".join(args)))
+            del fmt[:]
+            del args[:]
+
+    for i, (oid, fc, send_func) in enumerate(params):
+        if oid == -1:
+            fmt.append("i")
+            args.append("-1")
+        elif send_func in FIXED_WIDTH_SENDS:
+            code, length = FIXED_WIDTH_SENDS[send_func]
+            fmt.append("i" + code)
+            args.extend((str(length), "values[%d]" % i))
+        else:
+            end_run()
+            namespace["send_%d" % i] = send_func
+            lines.append("val_%d = send_%d(values[%d])" % (i, i, i))
+            parts.append("i_pack(len(val_%d))" % i)
+            parts.append("val_%d" % i)
+    end_run()
+
+    src = ["def encode(values):"]
+    src.extend("    " + line for line in lines)
+    src.append("    return empty.join((%s,))" % ", ".join(parts))
+    exec("\n".join(src), namespace)
+    return namespace["encode"]
+
+
 def int2send(v):
     return h_pack(v)
 
 
+if PY2:
+    def int_from_bytes(data):
+        return int(data.encode("hex"), 16)
+else:
+    def int_from_bytes(data):
+        return int.from_bytes(data, "big")
+
+
+# See inet_recv for the binary format of inet and cidr values.
+def inet_address_send(v):
+    packed = v.packed
+    return BBBB_pack(
+        2 if v.version == 4 else 3, v.max_prefixlen, 0, len(packed)) + packed
+
+
+def inet_interface_send(v):
+    packed = v.packed
+    return BBBB_pack(
+        2 if v.version == 4 else 3, v.network.prefixlen, 0,
+        len(packed)) + packed
+
+
+def cidr_send(v):
+    packed = v.network_address.packed
+    return BBBB_pack(
+        2 if v.version == 4 else 3, v.prefixlen, 1, len(packed)) + packed
+
+
 def numeric_recv(data, offset, recv):
     num_digits, weight, sign, scale = hhhh_unpack(data, offset)
     pos_weight = max(0, weight) + 1
@@ -1927,6 +3643,33 @@ def array_check_dimensions(arr):
         return []
 
 
+# Int32 - Number of dimensions.
+# Int32 - 1 if the array has NULLs, otherwise 0.
+# Int32 - Element type oid.
+# For each dimension:
+#   Int32 - Length of the dimension.
+#   Int32 - Lower bound of the dimension, always 1.
+# For each element:
+#   Int32 - Length of the element, or -1 for NULL.
+#   Byte[n] - The element in binary format.
+def array_send(arr, oid, send_func):
+    if len(arr) == 0:
+        return iii_pack(0, 0, oid)
+    has_null = array_has_null(arr)
+    dim_lengths = array_dim_lengths(arr)
+    data = bytearray(iii_pack(len(dim_lengths), has_null, oid))
+    for i in dim_lengths:
+        data.extend(ii_pack(i, 1))
+    for v in array_flatten(arr):
+        if v is None:
+            data += i_pack(-1)
+        else:
+            inner_data = send_func(v)
+            data += i_pack(len(inner_data))
+            data += inner_data
+    return data
+
+
 def array_has_null(arr):
     for v in array_flatten(arr):
         if v is None:
@@ -2001,15 +3744,8 @@ class PreparedStatement(object):
         # Stability: Added in v1.03, stability guaranteed for v1.xx.
         self.row_count = -1
 
-        global statement_number
-        try:
-            statement_number_lock.acquire()
-            self._statement_number = statement_number
-            statement_number += 1
-        finally:
-            statement_number_lock.release()
-
         self.c = connection
+        self._statement_number = next(connection._statement_numbers)
         self.portal_name = None
         if statement_name is None:
             self.statement_name = "pg8000_statement_" + \
@@ -2018,7 +3754,8 @@ class PreparedStatement(object):
             self.statement_name = statement_name
         self._cached_rows = deque()
         self.statement, self.make_args = convert_paramstyle(paramstyle, query)
-        self.params = self.c.make_params(self.make_args(values))
+        self.params, self.encode_params = self.c.make_param_encoder(
+            self.make_args(values))
         self.param_fcs = tuple(x[1] for x in self.params)
         self.statement_row_desc = None
         self.c.parse(self, self.statement)
@@ -2028,9 +3765,7 @@ class PreparedStatement(object):
     def close(self):
         if self.statement_name != "":  # don't close unnamed statement
             self.c.close_statement(self)
-        if self.portal_name is not None:
-            self.c.close_portal(self)
-            self.portal_name = None
+        self.c.close_portal(self)
 
     def get_row_description(self):
         if self.portal_row_desc is not None:
@@ -2044,27 +3779,24 @@ class PreparedStatement(object):
     def execute(self, values=None, stream=None):
         try:
             self._lock.acquire()
-            # cleanup last execute
-            self._cached_rows.clear()
-            self.row_count = -1
-            self.portal_suspended = False
-            try:
-                portal_number_lock.acquire()
-                global portal_number
-                self.portal_name = "pg8000_portal_" + str(portal_number)
-                portal_number += 1
-            finally:
-                portal_number_lock.release()
-
-            self.cmd = None
-            self.stream = stream
-            self.portal_row_desc = None
+            self._begin_execute(stream)
             self.c.bind(self, self.make_args(values))
             if len(self.portal_row_desc) == 0:
                 self.c.close_portal(self)
         finally:
             self._lock.release()
 
+    def _begin_execute(self, stream):
+        # cleanup last execute
+        self._cached_rows.clear()
+        self.row_count = -1
+        self.portal_suspended = False
+        self.portal_name = "pg8000_portal_" + str(next(self.c._portal_numbers))
+
+        self.cmd = None
+        self.stream = stream
+        self.portal_row_desc = None
+
     ##
     # Read a row from the database server, and return it as a tuple of values.
     # Returns None after the last row.
@@ -2130,6 +3862,13 @@ class PreparedStatement(object):
         return DataIterator(self, PreparedStatement.read_dict)
 
 
+def inspect_macaddr(value):
+    if len(value) == 8:
+        return (774, FC_BINARY, byteasend)
+    else:
+        return (829, FC_BINARY, byteasend)
+
+
 def inspect_int(value):
     if min_int2 < value < max_int2:
         return (21, FC_BINARY, h_pack)
@@ -52,6 +52,22 @@ class CursorClosedError(InterfaceError):
         InterfaceError.__init__(self, "cursor is closed")
 
 
+##
+# Raised by a connection pool when no connection becomes available before the
+# timeout.
+class PoolTimeoutError(InterfaceError):
+    def __init__(self):
+        InterfaceError.__init__(
+            self, "timed out waiting for a connection from the pool")
+
+
+##
+# Raised by a connection pool that has been closed.
+class PoolClosedError(InterfaceError):
+    def __init__(self):
+        InterfaceError.__init__(self, "connection pool is closed")
+
+
 class DatabaseError(Error):
     pass
 
@@ -133,3 +149,20 @@ class QueryParameterIndexError(ProgrammingError):
 # Some sort of parse error occured during query parameterization.
 class QueryParameterParseError(ProgrammingError):
     pass
+
+
+##
+# Raised when a statement is cancelled because its timeout or deadline
+# passed.  The second argument is the error sent by the server, or None if
+# the deadline passed before the statement could be sent.
+class StatementTimeoutError(OperationalError):
+    pass
+
+
+##
+# Raised by bulk.copy_from_parallel when COMMIT PREPARED fails for some of
+# the prepared transactions of a two-phase load.  The second argument is the
+# list of the transaction ids still outstanding, which must be committed or
+# rolled back by hand, and the third is the list of the errors.
+class CommitPreparedError(OperationalError):
+    pass
@@ -58,7 +58,20 @@ class Bytea(binary_type):
         pass
 
 
+##
+# The raw 6 (macaddr) or 8 (macaddr8) bytes of a MAC address.  The usual
+# colon-separated text form is available with str().
+class Macaddr(binary_type):
+    def __str__(self):
+        return ":".join("%02x" % c for c in bytearray(self))
+
+    def __repr__(self):
+        return "<Macaddr %s>" % (str(self),)
+
+
 class Interval(object):
+    __slots__ = ("_microseconds", "_days", "_months")
+
     def __init__(self, microseconds=0, days=0, months=0):
         self.microseconds = microseconds
         self.days = days
@@ -95,6 +108,47 @@ class Interval(object):
     days = property(lambda self: self._days, _setDays)
     months = property(lambda self: self._months, _setMonths)
 
+    ##
+    # Create an Interval from a datetime.timedelta.  The months value of the
+    # new Interval is always zero.
+    @classmethod
+    def from_timedelta(cls, value):
+        return cls(
+            microseconds=value.seconds * 1000000 + value.microseconds,
+            days=value.days)
+
+    ##
+    # Return this interval as a datetime.timedelta.  Raises ValueError if the
+    # interval has a non-zero months value, as a timedelta can't represent
+    # months.
+    def to_timedelta(self):
+        if self._months != 0:
+            raise ValueError(
+                "an interval with months can't be represented as a timedelta")
+        return datetime.timedelta(
+            days=self._days, microseconds=self._microseconds)
+
+    ##
+    # Create an Interval from a dateutil.relativedelta.relativedelta.  Only
+    # the relative fields (years, months, weeks, days, hours, minutes, seconds
+    # and microseconds) are used.
+    @classmethod
+    def from_relativedelta(cls, value):
+        return cls(
+            microseconds=int(
+                ((value.hours * 60 + value.minutes) * 60 + value.seconds) *
+                1000000 + value.microseconds),
+            days=int(value.days), months=int(value.years * 12 + value.months))
+
+    ##
+    # Return this interval as a dateutil.relativedelta.relativedelta.  This
+    # requires the dateutil package.
+    def to_relativedelta(self):
+        from dateutil.relativedelta import relativedelta
+        return relativedelta(
+            months=self._months, days=self._days,
+            microseconds=self._microseconds)
+
     def __repr__(self):
         return "<Interval %s months %s days %s microseconds>" % (
             self.months, self.days, self.microseconds)
@@ -106,3 +160,95 @@ class Interval(object):
 
     def __neq__(self, other):
         return not self.__eq__(other)
+
+
+##
+# Create an Interval without the type and range checks done by the
+# constructor.  Only for values that are known to be valid, such as those
+# received from the server.
+def interval_unchecked(microseconds, days, months):
+    value = object.__new__(Interval)
+    value._microseconds = microseconds
+    value._days = days
+    value._months = months
+    return value
+
+
+# Range flags, the same values as used by the server in the binary format.
+RANGE_EMPTY = 0x01
+RANGE_LB_INC = 0x02
+RANGE_UB_INC = 0x04
+RANGE_LB_INF = 0x08
+RANGE_UB_INF = 0x10
+
+range_bounds_flags = {
+    "[)": RANGE_LB_INC,
+    "(]": RANGE_UB_INC,
+    "[]": RANGE_LB_INC | RANGE_UB_INC,
+    "()": 0}
+
+
+##
+# A range value, eg. an int4range or a tsrange.  A lower or upper bound of
+# None means that the range is unbounded on that side.  The bounds argument
+# is one of "[)", "(]", "[]" or "()", where a square bracket means that the
+# bound is inclusive.
+class Range(object):
+    __slots__ = ("lower", "upper", "_flags")
+
+    def __init__(self, lower=None, upper=None, bounds="[)", is_empty=False):
+        if is_empty:
+            self.lower = self.upper = None
+            self._flags = RANGE_EMPTY
+            return
+        try:
+            flags = range_bounds_flags[bounds]
+        except KeyError:
+            raise ValueError("bounds must be one of '[)', '(]', '[]' or '()'")
+        if lower is None:
+            flags = (flags & ~RANGE_LB_INC) | RANGE_LB_INF
+        if upper is None:
+            flags = (flags & ~RANGE_UB_INC) | RANGE_UB_INF
+        self.lower = lower
+        self.upper = upper
+        self._flags = flags
+
+    is_empty = property(lambda self: bool(self._flags & RANGE_EMPTY))
+    lower_inc = property(lambda self: bool(self._flags & RANGE_LB_INC))
+    upper_inc = property(lambda self: bool(self._flags & RANGE_UB_INC))
+    lower_inf = property(lambda self: bool(self._flags & RANGE_LB_INF))
+    upper_inf = property(lambda self: bool(self._flags & RANGE_UB_INF))
+
+    @property
+    def bounds(self):
+        if self._flags & RANGE_EMPTY:
+            return None
+        return ("[" if self._flags & RANGE_LB_INC else "(") + \
+            ("]" if self._flags & RANGE_UB_INC else ")")
+
+    def __repr__(self):
+        if self._flags & RANGE_EMPTY:
+            return "<Range empty>"
+        return "<Range %s%r, %r%s>" % (
+            self.bounds[0], self.lower, self.upper, self.bounds[1])
+
+    def __eq__(self, other):
+        return isinstance(other, Range) and self._flags == other._flags and \
+            self.lower == other.lower and self.upper == other.upper
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((self._flags, self.lower, self.upper))
+
+
+##
+# Create a Range from flags in the server's binary format, without checking
+# them.  Only for values received from the server.
+def range_unchecked(flags, lower, upper):
+    value = object.__new__(Range)
+    value._flags = flags
+    value.lower = lower
+    value.upper = upper
+    return value
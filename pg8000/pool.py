@@ -0,0 +1,441 @@
+# vim: sw=4:expandtab:foldmethod=marker
+#
+# Copyright (c) 2007-2009, Mathieu Fenniak
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# * The name of the author may not be used to endorse or promote products
+# derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+__author__ = "Mathieu Fenniak"
+
+import os
+import threading
+import time
+from collections import deque
+from sys import exc_info
+from pg8000 import dbapi
+from pg8000.errors import ProgrammingError, PoolTimeoutError, PoolClosedError
+
+
+##
+# The statements run to discard the session state of a connection returned
+# to a pool with discard set.  They do what DISCARD ALL does, apart from
+# deallocating the connection's own prepared statements, and each must run
+# outside a transaction.
+DISCARD_STATEMENTS = (
+    "CLOSE ALL", "SET SESSION AUTHORIZATION DEFAULT", "RESET ALL",
+    "UNLISTEN *", "SELECT pg_advisory_unlock_all()", "DISCARD PLANS",
+    "DISCARD TEMP")
+
+
+##
+# Counters of the activity of a connection pool.
+# <p>
+# Stability: Added in v1.09.
+class PoolStats(object):
+    def __init__(self):
+        ##
+        # The number of connections handed out by the pool.
+        self.checkouts = 0
+
+        ##
+        # The number of checkouts that had to wait for a connection to be
+        # returned.
+        self.waits = 0
+
+        ##
+        # The total time, in seconds, that checkouts waited.
+        self.wait_seconds = 0.0
+
+        ##
+        # The longest time, in seconds, that a checkout waited.
+        self.max_wait_seconds = 0.0
+
+        ##
+        # The number of checkouts that gave up waiting.
+        self.timeouts = 0
+
+        ##
+        # The number of connections opened by the pool.
+        self.connects = 0
+
+        ##
+        # The number of connections the pool has closed or dropped, because
+        # they were broken, too old, idle for too long or discarded.
+        self.closes = 0
+
+    average_wait_seconds = property(
+        lambda self: self.wait_seconds / self.waits if self.waits else 0.0)
+
+    def __repr__(self):
+        return "<PoolStats %s checkouts, %s waits, %.3f seconds waiting, " \
+            "%s timeouts>" % (
+                self.checkouts, self.waits, self.wait_seconds, self.timeouts)
+
+
+##
+# A thread-safe pool of connections.
+# <p>
+# Connections are opened as needed, up to max_size, and handed out with
+# getconn.  When all of them are in use, getconn waits for one to be returned
+# with putconn.  A returned connection has its transaction rolled back before
+# it's handed out again.
+# <p>
+# The pool is safe to use across os.fork(): a child process never uses the
+# connections of its parent, but starts with an empty pool of its own.
+# <p>
+# Stability: Added in v1.09.
+class ConnectionPool(object):
+
+    ##
+    # @param connect_args   A dictionary of the keyword arguments passed to
+    # {@link #connect connect} to open each connection.
+    #
+    # @param min_size   The number of connections opened up front, and kept
+    # open however long they're idle.
+    #
+    # @param max_size   The largest number of connections open at once.
+    #
+    # @param timeout    The default number of seconds that getconn waits for
+    # a connection.
+    #
+    # @param max_lifetime   If not None, connections that have been open for
+    # longer than this many seconds are closed instead of being handed out or
+    # returned to the pool.
+    #
+    # @param max_idle   If not None, connections beyond min_size that have
+    # been idle for longer than this many seconds are closed.
+    #
+    # @param check_idle If not None, connections that have been idle for
+    # longer than this many seconds are checked with a ping before being
+    # handed out, and replaced if broken.  0 checks every connection.
+    #
+    # @param discard    If true, the session state of returned connections,
+    # such as settings, temporary tables and LISTENs, is discarded.
+    def __init__(
+            self, connect_args, min_size=0, max_size=10, timeout=30.0,
+            max_lifetime=None, max_idle=None, check_idle=1.0, discard=False):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ProgrammingError(
+                "pool sizes must satisfy 0 <= min_size <= max_size and "
+                "max_size >= 1")
+        self.connect_args = connect_args
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_idle = check_idle
+        self.discard = discard
+
+        ##
+        # The {@link #PoolStats PoolStats} of the pool.
+        self.stats = PoolStats()
+        self._closed = False
+        self._pid = None
+        self._reset_state()
+        self._fill()
+
+    def _reset_state(self):
+        if self._pid is None:
+            self._parent_connections = set()
+        else:
+            # The parent's connections that were in use, which may still be
+            # returned with putconn.  They're kept themselves rather than by
+            # id, since once the rest are dropped a new connection could
+            # have the id of one of them.
+            self._parent_connections = set(
+                conn for conn_id, (conn, opened) in self._connections.items()
+                if conn_id in self._in_use)
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        # (connection, idle since), most recently returned on the right
+        self._idle = deque()
+        # id(connection) -> (connection, time opened)
+        self._connections = {}
+        # the ids of the connections handed out
+        self._in_use = set()
+        # the connections open or being opened
+        self._size = 0
+
+    def _check_pid(self):
+        if os.getpid() != self._pid:
+            # Forked.  The parent's connections are dropped without being
+            # closed, since closing them would end the parent's sessions.
+            self._reset_state()
+
+    ##
+    # The number of connections open, whether idle or in use.
+    size = property(lambda self: self._size)
+
+    ##
+    # The number of idle connections.
+    idle = property(lambda self: len(self._idle))
+
+    def _open(self):
+        try:
+            conn = dbapi.connect(**self.connect_args)
+        except Exception:
+            self._lock.acquire()
+            try:
+                self._size -= 1
+                self._available.notify()
+            finally:
+                self._lock.release()
+            raise exc_info()[1]
+        self._lock.acquire()
+        try:
+            self._connections[id(conn)] = (conn, time.time())
+            self.stats.connects += 1
+        finally:
+            self._lock.release()
+        return conn
+
+    def _drop(self, conn, close=True):
+        self._lock.acquire()
+        try:
+            del self._connections[id(conn)]
+            self._in_use.discard(id(conn))
+            self._size -= 1
+            self.stats.closes += 1
+            self._available.notify()
+        finally:
+            self._lock.release()
+        if close:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _expired(self, conn, now):
+        return self.max_lifetime is not None and \
+            now - self._connections[id(conn)][1] > self.max_lifetime
+
+    def _fill(self):
+        while True:
+            self._lock.acquire()
+            try:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            finally:
+                self._lock.release()
+            conn = self._open()
+            self._lock.acquire()
+            try:
+                self._idle.append((conn, time.time()))
+                self._available.notify()
+            finally:
+                self._lock.release()
+
+    ##
+    # Takes a connection from the pool, opening one if none is idle and the
+    # pool isn't full, or else waiting for one to be returned.
+    # <p>
+    # Stability: Added in v1.09.
+    #
+    # @param timeout    The number of seconds to wait, or None for the
+    # timeout of the pool.  Raises {@link #PoolTimeoutError PoolTimeoutError}
+    # if no connection is available in time.
+    #
+    # @return A {@link #ConnectionWrapper ConnectionWrapper}, which must be
+    # given back with putconn.
+    def getconn(self, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        self._check_pid()
+        begin_time = time.time()
+        waited = False
+        while True:
+            conn = None
+            self._lock.acquire()
+            try:
+                while True:
+                    if self._closed:
+                        raise PoolClosedError()
+                    if len(self._idle) > 0:
+                        conn, idle_since = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = begin_time + timeout - time.time()
+                    if remaining <= 0:
+                        self.stats.timeouts += 1
+                        raise PoolTimeoutError()
+                    waited = True
+                    self._available.wait(remaining)
+            finally:
+                self._lock.release()
+
+            if conn is None:
+                conn = self._open()
+            else:
+                now = time.time()
+                if self._expired(conn, now):
+                    self._drop(conn)
+                    continue
+                if self.check_idle is not None and \
+                        now - idle_since >= self.check_idle:
+                    try:
+                        conn.ping()
+                    except Exception:
+                        self._drop(conn)
+                        continue
+
+            wait = time.time() - begin_time
+            self._lock.acquire()
+            try:
+                self._in_use.add(id(conn))
+                self.stats.checkouts += 1
+                if waited:
+                    self.stats.waits += 1
+                    self.stats.wait_seconds += wait
+                    self.stats.max_wait_seconds = max(
+                        self.stats.max_wait_seconds, wait)
+            finally:
+                self._lock.release()
+            return conn
+
+    ##
+    # Gives a connection taken with getconn back to the pool.  Its
+    # transaction is rolled back, and autocommit is turned off again.  A
+    # connection that is broken, closed or too old is closed instead of being
+    # kept.
+    # <p>
+    # Stability: Added in v1.09.
+    #
+    # @param conn   The connection.
+    #
+    # @param discard    If true, the session state of the connection is
+    # discarded.  Defaults to the discard setting of the pool.
+    def putconn(self, conn, discard=None):
+        self._check_pid()
+        self._lock.acquire()
+        try:
+            if conn in self._parent_connections:
+                # a connection of the parent process, so just drop it
+                self._parent_connections.remove(conn)
+                return
+            if id(conn) not in self._in_use:
+                raise ProgrammingError(
+                    "connection isn't one taken from the pool")
+            self._in_use.remove(id(conn))
+        finally:
+            self._lock.release()
+        if discard is None:
+            discard = self.discard
+
+        if conn._sock is None:
+            self._drop(conn, close=False)
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            if discard:
+                conn.autocommit = True
+                cursor = conn.cursor()
+                try:
+                    for statement in DISCARD_STATEMENTS:
+                        cursor.execute(statement)
+                finally:
+                    cursor.close()
+                try:
+                    conn.notifies_lock.acquire()
+                    del conn.notifies[:]
+                finally:
+                    conn.notifies_lock.release()
+            conn.autocommit = False
+        except Exception:
+            self._drop(conn)
+            return
+
+        now = time.time()
+        close = []
+        self._lock.acquire()
+        try:
+            if self._closed or self._expired(conn, now):
+                close.append(conn)
+            else:
+                self._idle.append((conn, now))
+                self._available.notify()
+            close.extend(self._take_idle(now))
+        finally:
+            self._lock.release()
+        for conn in close:
+            self._drop(conn)
+
+    def _take_idle(self, now):
+        # Removes from the idle connections those too old or idle for too
+        # long, oldest first, and returns them.  Called with the lock held.
+        taken = []
+        kept = deque()
+        for conn, idle_since in self._idle:
+            if self._closed or self._expired(conn, now) or (
+                    self.max_idle is not None and
+                    now - idle_since > self.max_idle and
+                    self._size - len(taken) > self.min_size):
+                taken.append(conn)
+            else:
+                kept.append((conn, idle_since))
+        self._idle = kept
+        return taken
+
+    ##
+    # Closes the idle connections that are too old or have been idle for too
+    # long, and opens connections to bring the pool back up to min_size.
+    # This is also done whenever a connection is returned, but can be called
+    # periodically to shrink a pool that isn't being used.
+    # <p>
+    # Stability: Added in v1.09.
+    def reap(self):
+        self._check_pid()
+        self._lock.acquire()
+        try:
+            taken = self._take_idle(time.time())
+        finally:
+            self._lock.release()
+        for conn in taken:
+            self._drop(conn)
+        self._fill()
+
+    ##
+    # Closes the idle connections of the pool.  Connections in use are closed
+    # when they're returned, and getconn raises
+    # {@link #PoolClosedError PoolClosedError}.
+    # <p>
+    # Stability: Added in v1.09.
+    def close(self):
+        self._check_pid()
+        self._lock.acquire()
+        try:
+            self._closed = True
+            taken = self._take_idle(time.time())
+            self._available.notify_all()
+        finally:
+            self._lock.release()
+        for conn in taken:
+            self._drop(conn)
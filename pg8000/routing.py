@@ -0,0 +1,397 @@
+# vim: sw=4:expandtab:foldmethod=marker
+#
+# Copyright (c) 2007-2009, Mathieu Fenniak
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# * The name of the author may not be used to endorse or promote products
+# derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = "Mathieu Fenniak"
+
+import threading
+import time
+from pg8000.six import Iterator
+from pg8000.errors import (
+    ProgrammingError, CursorClosedError, ConnectionClosedError)
+
+
+##
+# The query run on a replica to find whether it's in recovery, roughly how
+# many seconds it's behind the primary, and the WAL position it has replayed
+# up to.  A replica that has replayed everything it has received is taken to
+# be up to date, since the time of the last replayed transaction says nothing
+# about the lag while the primary is idle.
+REPLICA_STATUS_QUERY = (
+    "SELECT pg_is_in_recovery(), "
+    "CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END, "
+    "pg_last_wal_replay_lsn()::text")
+
+
+# Turns a WAL position such as '16/B374D848' into an int.
+def parse_lsn(text):
+    hi, lo = text.split("/")
+    return (int(hi, 16) << 32) + int(lo, 16)
+
+
+##
+# Sends read-only transactions to replica servers, and all other transactions
+# to the primary server.  Each server has its own
+# {@link #ConnectionPool ConnectionPool}, and connections for the router are
+# opened with {@link #ReplicaRouter.connect connect}.
+# <p>
+# Stability: Added in v1.09.
+class ReplicaRouter(object):
+
+    ##
+    # @param primary    The ConnectionPool of the primary server.
+    #
+    # @param replicas   A list of the ConnectionPools of the replicas.
+    #
+    # @param balance    How a replica is picked for each read-only
+    # transaction: 'round-robin', or 'least-loaded', which picks the replica
+    # with the fewest connections in use.
+    #
+    # @param max_replay_lag     If not None, replicas that are more than this
+    # many seconds behind the primary aren't used.
+    #
+    # @param lag_check_interval     The number of seconds for which the status
+    # of a replica is reused before it's checked again.  A replica that can't
+    # be connected to is skipped for this long.
+    #
+    # @param read_your_writes   If true, after a connection has committed a
+    # transaction on the primary, its read-only transactions only go to
+    # replicas that have replayed that commit.
+    def __init__(
+            self, primary, replicas, balance='round-robin',
+            max_replay_lag=None, lag_check_interval=1.0,
+            read_your_writes=False):
+        if balance not in ('round-robin', 'least-loaded'):
+            raise ProgrammingError(
+                "balance must be 'round-robin' or 'least-loaded'")
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.balance = balance
+        self.max_replay_lag = max_replay_lag
+        self.lag_check_interval = lag_check_interval
+        self.read_your_writes = read_your_writes
+        self._lock = threading.Lock()
+        self._next = 0
+        # replica index -> (time checked, lag in seconds, replayed position),
+        # where the lag is None if unknown, and the position is None for a
+        # server that isn't in recovery
+        self._status = {}
+        # replica index -> time at which a connection to it last failed
+        self._failed = {}
+
+    ##
+    # Returns a new {@link #RoutingConnection RoutingConnection}.
+    # <p>
+    # Stability: Added in v1.09.
+    def connect(self):
+        return RoutingConnection(self)
+
+    ##
+    # Closes the pools of the primary and the replicas.
+    # <p>
+    # Stability: Added in v1.09.
+    def close(self):
+        self.primary.close()
+        for pool in self.replicas:
+            pool.close()
+
+    def _replica_order(self):
+        n = len(self.replicas)
+        self._lock.acquire()
+        try:
+            start = self._next
+            self._next = (start + 1) % max(n, 1)
+        finally:
+            self._lock.release()
+        order = [(start + i) % n for i in range(n)]
+        if self.balance == 'least-loaded':
+            # sorted() is stable, so ties are broken round-robin
+            order.sort(
+                key=lambda i: self.replicas[i].size - self.replicas[i].idle)
+        return order
+
+    def _usable(self, index, min_lsn, now):
+        if now - self._failed.get(index, 0) < self.lag_check_interval:
+            return False
+        try:
+            checked, lag, lsn = self._status[index]
+        except KeyError:
+            return None
+        if self.max_replay_lag is not None:
+            if now - checked > self.lag_check_interval:
+                return None
+            if lag is None or lag > self.max_replay_lag:
+                return False
+        if min_lsn is not None and lsn is not None and lsn < min_lsn:
+            # it may have caught up since it was checked
+            return None
+        return True
+
+    def _check(self, index, conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(REPLICA_STATUS_QUERY)
+            in_recovery, lag, lsn = cursor.fetchone()
+        finally:
+            cursor.close()
+        if in_recovery:
+            lag = None if lag is None else float(lag)
+            lsn = None if lsn is None else parse_lsn(lsn)
+        else:
+            lag, lsn = 0, None
+        self._status[index] = (time.time(), lag, lsn)
+
+    # Returns the pool and a connection for a read-only transaction, trying
+    # each replica in turn before falling back to the primary.
+    def _acquire_read(self, min_lsn):
+        for index in self._replica_order():
+            now = time.time()
+            if self._usable(index, min_lsn, now) is False:
+                continue
+            pool = self.replicas[index]
+            try:
+                conn = pool.getconn()
+            except Exception:
+                self._failed[index] = time.time()
+                continue
+            try:
+                if self._usable(index, min_lsn, now) is None:
+                    self._check(index, conn)
+                if self._usable(index, min_lsn, time.time()):
+                    return pool, conn
+            except Exception:
+                pass
+            pool.putconn(conn)
+        return self.primary, self.primary.getconn()
+
+
+##
+# A connection that runs each transaction on a connection taken from one of
+# the pools of a {@link #ReplicaRouter ReplicaRouter}.  The server is chosen
+# when the transaction's first statement is executed, and the connection is
+# given back to its pool on commit or rollback.
+# <p>
+# A RoutingConnection should only be used by one thread at a time.
+# <p>
+# Stability: Added in v1.09.
+class RoutingConnection(object):
+    def __init__(self, router):
+        self._router = router
+        self._pool = None
+        self._conn = None
+        self._cursors = []
+
+        ##
+        # If True, transactions are read-only, and are sent to a replica.  A
+        # change takes effect at the start of the next transaction.
+        self.read_only = False
+
+        ##
+        # The WAL position, as an int, of the last transaction that this
+        # connection committed on the primary, when the router has
+        # read_your_writes set.  It can be copied to another connection, so
+        # that its reads also see the commit.
+        self.last_commit_lsn = None
+
+    ##
+    # The {@link #ConnectionWrapper ConnectionWrapper} that the current
+    # transaction is running on, or None between transactions.
+    connection = property(lambda self: self._conn)
+
+    def _cursor_for(self, cursor):
+        if self._router is None:
+            raise ConnectionClosedError()
+        if self._conn is None:
+            if self.read_only:
+                min_lsn = self.last_commit_lsn \
+                    if self._router.read_your_writes else None
+                self._pool, self._conn = self._router._acquire_read(min_lsn)
+            else:
+                self._pool = self._router.primary
+                self._conn = self._pool.getconn()
+        if cursor._cursor is None:
+            cursor._cursor = self._conn.cursor()
+            self._cursors.append(cursor)
+        return cursor._cursor
+
+    def _release(self):
+        conn, pool = self._conn, self._pool
+        self._conn = self._pool = None
+        for cursor in self._cursors:
+            try:
+                cursor._cursor.close()
+            except Exception:
+                pass
+            cursor._cursor = None
+        del self._cursors[:]
+        pool.putconn(conn)
+
+    def _record_commit(self, conn):
+        conn.autocommit = True
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT pg_current_wal_lsn()::text")
+            lsn = parse_lsn(cursor.fetchone()[0])
+        finally:
+            cursor.close()
+            conn.autocommit = False
+        if self.last_commit_lsn is None or lsn > self.last_commit_lsn:
+            self.last_commit_lsn = lsn
+
+    ##
+    # Returns a new {@link #RoutingCursor RoutingCursor}.
+    # <p>
+    # Stability: Added in v1.09.
+    def cursor(self):
+        if self._router is None:
+            raise ConnectionClosedError()
+        return RoutingCursor(self)
+
+    ##
+    # Commits the current transaction, and gives its connection back to the
+    # pool.
+    # <p>
+    # Stability: Added in v1.09.
+    def commit(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.commit()
+            if self._pool is self._router.primary and \
+                    self._router.read_your_writes:
+                self._record_commit(self._conn)
+        finally:
+            self._release()
+
+    ##
+    # Rolls back the current transaction, and gives its connection back to
+    # the pool.
+    # <p>
+    # Stability: Added in v1.09.
+    def rollback(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.rollback()
+        finally:
+            self._release()
+
+    ##
+    # Rolls back the current transaction, if any.  The connection can't be
+    # used afterwards.
+    # <p>
+    # Stability: Added in v1.09.
+    def close(self):
+        if self._router is None:
+            raise ConnectionClosedError()
+        if self._conn is not None:
+            self._release()
+        self._router = None
+
+
+##
+# A cursor of a {@link #RoutingConnection RoutingConnection}.  It has the
+# methods of a {@link #CursorWrapper CursorWrapper} for running queries and
+# fetching their results, which can be fetched until the transaction ends.
+# <p>
+# Stability: Added in v1.09.
+class RoutingCursor(Iterator):
+    def __init__(self, connection):
+        self._conn = connection
+        self._cursor = None
+        self._row_count = -1
+        self.arraysize = 1
+
+    def _current(self):
+        if self._conn is None:
+            raise CursorClosedError()
+        if self._cursor is None:
+            # not executed, or the transaction has ended
+            raise ProgrammingError("no result set")
+        return self._cursor
+
+    rowcount = property(lambda self: self._row_count)
+
+    description = property(
+        lambda self: None if self._cursor is None else
+        self._cursor.description)
+
+    def execute(
+            self, operation, args=(), stream=None, timeout=None,
+            deadline=None):
+        if self._conn is None:
+            raise CursorClosedError()
+        cursor = self._conn._cursor_for(self)
+        self._row_count = -1
+        cursor.execute(operation, args, stream, timeout, deadline)
+        self._row_count = cursor.rowcount
+
+    def executemany(
+            self, operation, parameter_sets, timeout=None, deadline=None):
+        if self._conn is None:
+            raise CursorClosedError()
+        cursor = self._conn._cursor_for(self)
+        self._row_count = -1
+        cursor.executemany(operation, parameter_sets, timeout, deadline)
+        self._row_count = cursor.rowcount
+
+    def fetchone(self):
+        return self._current().fetchone()
+
+    def fetchmany(self, size=None):
+        if size is None:
+            size = self.arraysize
+        return self._current().fetchmany(size)
+
+    def fetchall(self):
+        return self._current().fetchall()
+
+    def close(self):
+        if self._conn is None:
+            raise CursorClosedError()
+        if self._cursor is not None:
+            self._conn._cursors.remove(self)
+            self._cursor.close()
+            self._cursor = None
+        self._conn = None
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration()
+        return row
+
+    def __iter__(self):
+        return self
+
+    def setinputsizes(self, sizes):
+        pass
+
+    def setoutputsize(self, size, column=None):
+        pass
@@ -0,0 +1,46 @@
+from pg8000 import DBAPI
+from .connection_settings import db_connect
+import sys
+import threading
+import time
+
+
+# The number of seconds to run each test for.
+duration = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+# The numbers of threads to try.  Each thread has a connection of its own.
+thread_counts = (1, 2, 4, 8, 16, 32)
+
+
+def worker(db, stop, counts, index):
+    cursor = db.cursor()
+    n = 0
+    while not stop.is_set():
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+        db.commit()
+        n += 1
+    cursor.close()
+    counts[index] = n
+
+
+for thread_count in thread_counts:
+    connections = [DBAPI.connect(**db_connect) for i in range(thread_count)]
+    counts = [0] * thread_count
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=worker, args=(db, stop, counts, i))
+        for i, db in enumerate(connections)]
+    print("Beginning %s thread test..." % thread_count)
+    begin_time = time.time()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    end_time = time.time()
+    for db in connections:
+        db.close()
+    print("%s threads - %.0f transactions/s." % (
+        thread_count, sum(counts) / (end_time - begin_time)))
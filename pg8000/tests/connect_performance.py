@@ -0,0 +1,111 @@
+from pg8000 import DBAPI
+from .connection_settings import db_connect
+import socket
+import sys
+import time
+
+
+# The number of connections to open for each test.
+attempts = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+settings = {
+    "application_name": "connect_performance",
+    "search_path": "public",
+    "statement_timeout": "30000"}
+
+
+# Records the time at which each stage of opening the connection finished.
+class TimedConnection(DBAPI.Connection):
+    def _init_protocol(self):
+        self.times = {}
+        DBAPI.Connection._init_protocol(self)
+        auth = self.message_types[DBAPI.AUTHENTICATION_REQUEST]
+        ready = self.message_types[DBAPI.READY_FOR_QUERY]
+
+        def handle_AUTHENTICATION_REQUEST(data, ps):
+            auth(data, ps)
+            if DBAPI.i_unpack(data)[0] == 0:
+                self.times["auth"] = time.time()
+
+        def handle_READY_FOR_QUERY(data, ps):
+            ready(data, ps)
+            self.times.setdefault("ready", time.time())
+
+        self.message_types[DBAPI.AUTHENTICATION_REQUEST] = \
+            handle_AUTHENTICATION_REQUEST
+        self.message_types[DBAPI.READY_FOR_QUERY] = handle_READY_FOR_QUERY
+
+    def _send_startup(self, *args):
+        self.times["startup"] = time.time()
+        DBAPI.Connection._send_startup(self, *args)
+
+
+def timed_connect(**kwargs):
+    args = dict(
+        host='localhost', unix_sock=None, port=5432, database=None,
+        password=None, socket_timeout=60, ssl=False)
+    args.update(db_connect)
+    args.update(kwargs)
+    begin_time = time.time()
+    conn = TimedConnection(
+        args["user"], args["host"], args["unix_sock"], args["port"],
+        args["database"], args["password"], args["socket_timeout"],
+        args["ssl"], args.get("options"), args.get("startup_params"))
+    end_time = time.time()
+    conn.close()
+    times = conn.times
+    return (
+        times["startup"] - begin_time, times["auth"] - times["startup"],
+        times["ready"] - times["auth"], end_time - times["ready"],
+        end_time - begin_time)
+
+
+def tcp_connect():
+    if db_connect.get("unix_sock") is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = db_connect["unix_sock"]
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        address = (
+            db_connect.get("host", "localhost"), db_connect.get("port", 5432))
+    begin_time = time.time()
+    sock.connect(address)
+    end_time = time.time()
+    sock.close()
+    return end_time - begin_time
+
+
+def report(name, results):
+    results.sort()
+    print("%s - median %.2f ms, worst %.2f ms." % (
+        name, results[len(results) // 2] * 1000, results[-1] * 1000))
+
+
+print("Beginning connect test, %s connections..." % attempts)
+tcp = [tcp_connect() for i in range(attempts)]
+stages = list(zip(*[timed_connect() for i in range(attempts)]))
+report("TCP connect", tcp)
+report("TCP connect and TLS handshake", list(stages[0]))
+report("Authentication", list(stages[1]))
+report("Startup to first ReadyForQuery", list(stages[2]))
+report("Preparing transaction statements", list(stages[3]))
+report("Total", list(stages[4]))
+
+print("Beginning session settings test...")
+results = []
+for i in range(attempts):
+    begin_time = time.time()
+    db = DBAPI.connect(**db_connect)
+    cursor = db.cursor()
+    for name, value in settings.items():
+        cursor.execute("SET " + name + " = '" + value + "'")
+    db.close()
+    results.append(time.time() - begin_time)
+report("Connect, then SET each parameter", results)
+results = []
+for i in range(attempts):
+    begin_time = time.time()
+    db = DBAPI.connect(startup_params=settings, **db_connect)
+    db.close()
+    results.append(time.time() - begin_time)
+report("Connect with startup_params", results)
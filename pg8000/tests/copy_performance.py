@@ -0,0 +1,48 @@
+from pg8000 import DBAPI
+from .connection_settings import db_connect
+import os
+import sys
+import time
+import tempfile
+from contextlib import closing
+
+
+# The size of the file to load, in megabytes.
+file_size = int(sys.argv[1]) if len(sys.argv) > 1 else 2048
+
+# The values of copy_chunk_size to try.
+chunk_sizes = (8192, 64 * 1024, 1024 * 1024, 4 * 1024 * 1024)
+
+line = "12345\tSeason of mists and mellow fruitfulness\t2013-01-01\t7.4009\n"
+block = (line * (1024 * 1024 // len(line))).encode("ascii")
+
+with tempfile.NamedTemporaryFile(suffix=".copy") as f:
+    print("Writing a %s MB file..." % file_size)
+    while f.tell() < file_size * 1024 * 1024:
+        f.write(block)
+    f.flush()
+    size = os.path.getsize(f.name)
+
+    with closing(DBAPI.connect(**db_connect)) as db:
+        cursor = db.cursor()
+        cursor.execute(
+            "CREATE UNLOGGED TABLE copy_performance (f1 int, f2 text, "
+            "f3 date, f4 numeric)")
+        db.commit()
+        try:
+            for chunk_size in chunk_sizes:
+                db.copy_chunk_size = chunk_size
+                print("Beginning copy_from test, %s byte chunks..." % (
+                    chunk_size,))
+                for i in range(1, 4):
+                    cursor.execute("TRUNCATE copy_performance")
+                    with open(f.name, "rb") as stream:
+                        begin_time = time.time()
+                        cursor.copy_from(stream, "copy_performance")
+                        db.commit()
+                        end_time = time.time()
+                    print("Attempt %s - %.1f MB/s." % (
+                        i, size / (end_time - begin_time) / 1024 / 1024))
+        finally:
+            cursor.execute("DROP TABLE copy_performance")
+            db.commit()
@@ -0,0 +1,202 @@
+import unittest
+import asyncio
+from pg8000 import aio
+from pg8000.errors import (
+    ProgrammingError, CursorClosedError, PoolTimeoutError, PoolClosedError,
+    ConnectionClosedError)
+from .connection_settings import db_connect
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class Tests(unittest.TestCase):
+    def testQuery(self):
+        async def test():
+            conn = await aio.connect(**db_connect)
+            try:
+                cursor = conn.cursor()
+                # more rows than are read from the server at once
+                await cursor.execute(
+                    "SELECT i, i::text FROM generate_series(1, %s) i", (250,))
+                self.assertEqual(cursor.description[0][0], b"i")
+                self.assertEqual(await cursor.fetchone(), [1, "1"])
+                self.assertEqual(len(await cursor.fetchmany(10)), 10)
+                rows = await cursor.fetchall()
+                self.assertEqual(len(rows), 239)
+                self.assertEqual(rows[-1], [250, "250"])
+                self.assertEqual(await cursor.fetchone(), None)
+                await cursor.close()
+                try:
+                    await cursor.execute("SELECT 1")
+                    self.fail("expected an error")
+                except CursorClosedError:
+                    pass
+            finally:
+                await conn.close()
+        run(test())
+
+    def testAsyncFor(self):
+        async def test():
+            conn = await aio.connect(**db_connect)
+            try:
+                cursor = conn.cursor()
+                await cursor.execute("SELECT generate_series(1, 10)")
+                total = 0
+                async for row in cursor:
+                    total += row[0]
+                self.assertEqual(total, 55)
+            finally:
+                await conn.close()
+        run(test())
+
+    def testConcurrentTasks(self):
+        async def query(conn, i):
+            cursor = conn.cursor()
+            await cursor.execute(
+                "SELECT sum(i) FROM generate_series(1, %s) i", (i,))
+            return (await cursor.fetchone())[0]
+
+        async def test():
+            conn = await aio.connect(**db_connect)
+            try:
+                results = await asyncio.gather(
+                    *[query(conn, i) for i in range(1, 101)])
+                self.assertEqual(
+                    results, [i * (i + 1) // 2 for i in range(1, 101)])
+            finally:
+                await conn.close()
+        run(test())
+
+    def testTransactions(self):
+        async def test():
+            conn = await aio.connect(**db_connect)
+            try:
+                cursor = conn.cursor()
+                await cursor.execute(
+                    "CREATE TEMPORARY TABLE t_aio (f1 int)")
+                await conn.commit()
+                await cursor.executemany(
+                    "INSERT INTO t_aio VALUES (%s)", ((1,), (2,), (3,)))
+                self.assertEqual(cursor.rowcount, 3)
+                await conn.rollback()
+                await cursor.execute("SELECT count(*) FROM t_aio")
+                self.assertEqual(await cursor.fetchone(), [0])
+                await conn.rollback()
+            finally:
+                await conn.close()
+            # no transaction is open, but the connection is closed
+            for method in (conn.commit, conn.rollback):
+                try:
+                    await method()
+                    self.fail("expected an error")
+                except ConnectionClosedError:
+                    pass
+        run(test())
+
+    def testErrorRecovery(self):
+        async def test():
+            conn = await aio.connect(**db_connect)
+            try:
+                cursor = conn.cursor()
+                try:
+                    await cursor.execute("SELECT * FROM t_aio_missing")
+                    self.fail("expected an error")
+                except ProgrammingError:
+                    pass
+                await conn.rollback()
+                await cursor.execute("SELECT 1")
+                self.assertEqual(await cursor.fetchone(), [1])
+                await conn.ping()
+            finally:
+                await conn.close()
+        run(test())
+
+    # A task cancelled while waiting for the server leaves its responses
+    # unread, so the connection is closed rather than left out of step.
+    def testCancelledRoundTrip(self):
+        async def test():
+            conn = await aio.connect(**db_connect)
+            cursor = conn.cursor()
+            task = asyncio.ensure_future(cursor.execute("SELECT pg_sleep(1)"))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            try:
+                await cursor.execute("SELECT 1")
+                self.fail("expected an error")
+            except ConnectionClosedError:
+                pass
+        run(test())
+
+    def testPool(self):
+        async def query(pool, i):
+            async with pool.acquire() as conn:
+                cursor = conn.cursor()
+                await cursor.execute("SELECT %s", (i,))
+                return (await cursor.fetchone())[0]
+
+        async def test():
+            pool = aio.AsyncConnectionPool(db_connect, min_size=2, max_size=3)
+            async with pool:
+                self.assertEqual((pool.size, pool.idle), (2, 2))
+                results = await asyncio.gather(
+                    *[query(pool, i) for i in range(50)])
+                self.assertEqual(results, list(range(50)))
+                self.assertEqual(pool.size, 3)
+                self.assertEqual(pool.stats.checkouts, 50)
+            self.assertEqual(pool.size, 0)
+            try:
+                await pool.acquire()
+                self.fail("expected an error")
+            except PoolClosedError:
+                pass
+        run(test())
+
+    def testPoolWaiters(self):
+        async def test():
+            async with aio.AsyncConnectionPool(db_connect, max_size=2) as pool:
+                conns = [await pool.acquire(), await pool.acquire()]
+                try:
+                    await pool.acquire(timeout=0.1)
+                    self.fail("expected an error")
+                except PoolTimeoutError:
+                    pass
+
+                # waiting tasks are served in the order they asked
+                served = []
+
+                async def waiter(i):
+                    conn = await pool.acquire()
+                    served.append(i)
+                    await pool.release(conn)
+                waiters = [asyncio.ensure_future(waiter(i)) for i in range(5)]
+                await asyncio.sleep(0.1)
+                self.assertEqual(pool.waiting, 5)
+                for conn in conns:
+                    await pool.release(conn)
+                await asyncio.gather(*waiters)
+                self.assertEqual(served, list(range(5)))
+        run(test())
+
+    def testPoolRollbackOnRelease(self):
+        async def test():
+            async with aio.AsyncConnectionPool(db_connect, max_size=1) as pool:
+                async with pool.acquire() as conn:
+                    cursor = conn.cursor()
+                    await cursor.execute("SELECT 1")
+                    self.assertTrue(conn.in_transaction)
+                self.assertFalse(conn.in_transaction)
+        run(test())
+
+
+if __name__ == "__main__":
+    unittest.main()
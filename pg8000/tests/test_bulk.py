@@ -0,0 +1,182 @@
+import unittest
+import os
+import tempfile
+from pg8000 import dbapi, bulk
+from pg8000.errors import CommitPreparedError
+from sys import exc_info
+from .connection_settings import db_connect
+
+db = dbapi.connect(**db_connect)
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        try:
+            cursor = db.cursor()
+            cursor.execute("DROP TABLE IF EXISTS t_bulk")
+            # not a temporary table, so that the workers' connections can
+            # see it
+            cursor.execute(
+                "CREATE TABLE t_bulk (f1 int primary key, f2 int not null, "
+                "f3 varchar(50) null)")
+            db.commit()
+        finally:
+            cursor.close()
+
+    def tearDown(self):
+        try:
+            cursor = db.cursor()
+            cursor.execute("DROP TABLE t_bulk")
+            db.commit()
+        finally:
+            cursor.close()
+
+    def count(self):
+        try:
+            cursor = db.cursor()
+            cursor.execute("SELECT count(*), sum(f1) FROM t_bulk")
+            retval = cursor.fetchone()
+            db.rollback()
+            return retval
+        finally:
+            cursor.close()
+
+    def testCopyFromParallelFile(self):
+        fd, path = tempfile.mkstemp()
+        try:
+            f = os.fdopen(fd, "w")
+            for i in range(1000):
+                f.write("%s\t%s\tline %s\n" % (i, i, i))
+            f.close()
+            stats = bulk.copy_from_parallel(path, "t_bulk", db_connect, 3)
+            self.assertEqual(len(stats), 3)
+            self.assertEqual(sum(s.rows for s in stats), 1000)
+            self.assertEqual(
+                sum(s.bytes for s in stats), os.path.getsize(path))
+            self.assertEqual(self.count(), [1000, 499500])
+        finally:
+            os.remove(path)
+
+    def testCopyFromParallelRows(self):
+        rows = ((i, i, None) for i in range(1000))
+        stats = bulk.copy_from_parallel(
+            rows, "t_bulk", db_connect, 4, batch_size=10)
+        # the batches are dealt out in turn
+        self.assertEqual([s.rows for s in stats], [250, 250, 250, 250])
+        self.assertEqual(self.count(), [1000, 499500])
+
+    def testCopyFromParallelFailure(self):
+        # the NULL fails one worker, so nothing is loaded
+        rows = [(i, i, None) for i in range(1000)] + [(1000, None, None)]
+        self.assertRaises(
+            dbapi.ProgrammingError, bulk.copy_from_parallel, rows, "t_bulk",
+            db_connect, 4, batch_size=10)
+        self.assertEqual(self.count(), [0, None])
+
+    # The first COMMIT PREPARED fails, and the other workers' transactions
+    # are committed all the same.  Needs max_prepared_transactions >= 3.
+    def testCopyFromParallelCommitPreparedFailure(self):
+        finish_transaction = bulk.finish_transaction
+        calls = []
+
+        def failing_finish_transaction(conn, gid, command):
+            calls.append(gid)
+            if len(calls) == 1:
+                raise dbapi.OperationalError("commit failed")
+            finish_transaction(conn, gid, command)
+
+        # each worker gets one batch
+        rows = [(i, i, None) for i in range(999)]
+        bulk.finish_transaction = failing_finish_transaction
+        try:
+            try:
+                bulk.copy_from_parallel(
+                    rows, "t_bulk", db_connect, 3, batch_size=333,
+                    two_phase=True)
+                self.fail("CommitPreparedError not raised")
+            except CommitPreparedError:
+                e = exc_info()[1]
+            finally:
+                bulk.finish_transaction = finish_transaction
+            self.assertEqual(e.args[1], calls[:1])
+            self.assertEqual(len(e.args[2]), 1)
+            self.assertEqual(self.count()[0], 666)
+        finally:
+            # the outstanding transaction holds locks on t_bulk, which
+            # tearDown drops
+            if len(calls) > 0:
+                try:
+                    db.autocommit = True
+                    cursor = db.cursor()
+                    cursor.execute("ROLLBACK PREPARED '%s'" % (calls[0],))
+                finally:
+                    cursor.close()
+                    db.autocommit = False
+
+    def testRelay(self):
+        for binary in (False, True):
+            src = dbapi.connect(**db_connect)
+            dst = dbapi.connect(**db_connect)
+            try:
+                stats = bulk.relay(
+                    src, "SELECT i, i * 2 FROM generate_series(1, 1000) i",
+                    dst, "t_bulk", columns=("f1", "f2"), binary=binary)
+                self.assertEqual(stats.rows, 1000)
+                self.assertTrue(stats.bytes > 0)
+                dst.commit()
+                self.assertEqual(self.count(), [1000, 500500])
+
+                dst.cursor().execute("DELETE FROM t_bulk")
+                dst.commit()
+            finally:
+                src.close()
+                dst.close()
+
+    # The destination fails before it reads anything from the source, which
+    # must be left usable.
+    def testRelayMissingTable(self):
+        src = dbapi.connect(**db_connect)
+        dst = dbapi.connect(**db_connect)
+        try:
+            self.assertRaises(
+                dbapi.ProgrammingError, bulk.relay, src,
+                "SELECT i FROM generate_series(1, 1000) i", dst,
+                "t_bulk_missing")
+            cursor = src.cursor()
+            cursor.execute("SELECT 1")
+            self.assertEqual(cursor.fetchone(), [1])
+        finally:
+            src.close()
+            dst.close()
+
+    def testUpsert(self):
+        conn = dbapi.connect(**db_connect)
+        try:
+            stats = bulk.upsert(
+                conn, "t_bulk", ("f1", "f2"),
+                ((i, i) for i in range(100)), ("f1",))
+            self.assertEqual(
+                (stats.rows, stats.inserted, stats.updated), (100, 100, 0))
+
+            # the second batch reuses the staging table
+            stats = bulk.upsert(
+                conn, "t_bulk", ("f1", "f2"),
+                ((i, -i) for i in range(50, 150)), ("f1",))
+            self.assertEqual(
+                (stats.rows, stats.inserted, stats.updated), (100, 50, 50))
+            conn.commit()
+        finally:
+            conn.close()
+        self.assertEqual(self.count(), [150, 11175])
+
+        try:
+            cursor = db.cursor()
+            cursor.execute(
+                "SELECT f2 FROM t_bulk WHERE f1 IN (10, 60) ORDER BY f1")
+            self.assertEqual(cursor.fetchall(), ([10], [-60]))
+        finally:
+            cursor.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
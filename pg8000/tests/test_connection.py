@@ -3,6 +3,7 @@ from __future__ import with_statement
 import unittest
 from pg8000 import dbapi
 from contextlib import closing
+from sys import exc_info
 from .connection_settings import db_connect
 from pg8000.six import PY2, PRE_26
 
@@ -60,5 +61,59 @@ class Tests(unittest.TestCase):
             with closing(dbapi.connect(**data)):
                 pass
 
+    def testStartupParams(self):
+        data = db_connect.copy()
+        data["options"] = "-c geqo=off"
+        data["startup_params"] = {
+            "application_name": "pg8000_test", "statement_timeout": 5000}
+        db = dbapi.connect(**data)
+        try:
+            cursor = db.cursor()
+            cursor.execute(
+                "SELECT current_setting('application_name'), "
+                "current_setting('statement_timeout'), "
+                "current_setting('geqo'), current_setting('client_encoding')")
+            self.assertEqual(
+                tuple(cursor.fetchone()), ("pg8000_test", "5s", "off", "UTF8"))
+            cursor.close()
+        finally:
+            db.close()
+
+        data["startup_params"] = {"user": "someone-else"}
+        self.assertRaises(dbapi.InterfaceError, dbapi.connect, **data)
+
+        # The parameters are checked before anything is opened, so the error
+        # is the same with nothing listening.
+        try:
+            dbapi.connect(
+                user="u", host="localhost", port=1,
+                startup_params={"database": "x"})
+            self.fail("expected an error")
+        except dbapi.InterfaceError:
+            self.assertTrue("startup parameter" in str(exc_info()[1]))
+
+    def testTargetSessionAttrs(self):
+        data = db_connect.copy()
+        data["target_session_attrs"] = "read-write"
+        with closing(dbapi.connect(**data)):
+            pass
+        data["target_session_attrs"] = "standby"
+        self.assertRaises(dbapi.InterfaceError, dbapi.connect, **data)
+
+    def testHostList(self):
+        if db_connect.get("unix_sock") is not None:
+            return
+        data = db_connect.copy()
+        host = data.get("host", "localhost")
+        # nothing listens on port 1, so the first attempt fails straight away
+        data["host"] = [(host, 1), host]
+        with closing(dbapi.connect(**data)):
+            pass
+        # with the default target_session_attrs the server isn't asked its role
+        status = dbapi.host_statuses[(host, data.get("port", 5432))]
+        self.assertEqual(status[1], ())
+        data["host"] = [(host, 1)]
+        self.assertRaises(dbapi.InterfaceError, dbapi.connect, **data)
+
 if __name__ == "__main__":
     unittest.main()
@@ -3,6 +3,9 @@ from pg8000 import dbapi
 from .connection_settings import db_connect
 from pg8000.six import b, BytesIO
 from sys import exc_info
+import os
+import tempfile
+import datetime
 
 db = dbapi.connect(**db_connect)
 
@@ -89,6 +92,166 @@ class Tests(unittest.TestCase):
         finally:
             cursor.close()
 
+    def testCopyRows(self):
+        try:
+            cursor = db.cursor()
+            rows = ((i, i * 2, None if i % 2 else str(i)) for i in range(100))
+            cursor.copy_rows("t1", ("f1", "f2", "f3"), rows)
+            self.assertEqual(cursor.rowcount, 100)
+
+            cursor.execute("SELECT * FROM t1 ORDER BY f1 LIMIT 3")
+            retval = cursor.fetchall()
+            self.assertEqual(retval, ([0, 0, '0'], [1, 2, None], [2, 4, '2']))
+            db.rollback()
+        finally:
+            cursor.close()
+
+    def testCopyRowsAllColumns(self):
+        try:
+            cursor = db.cursor()
+            cursor.copy_rows("t1", None, [(1, 1, 'a'), (2, 2, 'b')])
+            self.assertEqual(cursor.rowcount, 2)
+
+            cursor.execute("SELECT * FROM t1 ORDER BY f1")
+            retval = cursor.fetchall()
+            self.assertEqual(retval, ([1, 1, 'a'], [2, 2, 'b']))
+            db.rollback()
+        finally:
+            cursor.close()
+
+    def testCopyRowsFailure(self):
+        def rows():
+            yield (1, 1, 'a')
+            raise ValueError("no more rows")
+
+        try:
+            # t1 has to outlive the rollbacks
+            db.commit()
+            cursor = db.cursor()
+            self.assertRaises(
+                dbapi.DataError, cursor.copy_rows, "t1", None, rows())
+            # the failed COPY aborts the transaction
+            db.rollback()
+            self.assertRaises(
+                dbapi.DataError, cursor.copy_rows, "t1", None, [(1, 1)])
+            db.rollback()
+
+            cursor.execute("SELECT count(*) FROM t1")
+            self.assertEqual(cursor.fetchone()[0], 0)
+            db.rollback()
+        finally:
+            cursor.close()
+
+    def testCopyFromPath(self):
+        fd, path = tempfile.mkstemp()
+        try:
+            os.write(fd, b("1\t1\t1\n2\t2\t2\n3\t3\t3\n"))
+            os.close(fd)
+            cursor = db.cursor()
+            cursor.copy_from_path(path, "t1")
+            self.assertEqual(cursor.rowcount, 3)
+
+            cursor.execute("SELECT * FROM t1 ORDER BY f1")
+            retval = cursor.fetchall()
+            self.assertEqual(retval, ([1, 1, '1'], [2, 2, '2'], [3, 3, '3']))
+            db.rollback()
+        finally:
+            cursor.close()
+            os.remove(path)
+
+    def testCopyCompressed(self):
+        try:
+            cursor = db.cursor()
+            cursor.copy_rows("t1", None, ((i, i, None) for i in range(1000)))
+            for compression in ("gzip", "bz2"):
+                stream = BytesIO()
+                cursor.copy_to(stream, "t1", compression=compression)
+                self.assertEqual(cursor.rowcount, 1000)
+                self.assertNotEqual(stream.getvalue()[:4], b("0\t0\t"))
+
+                cursor.execute("DELETE FROM t1")
+                stream.seek(0)
+                cursor.copy_from(stream, "t1", compression=compression)
+                self.assertEqual(cursor.rowcount, 1000)
+                cursor.execute("SELECT count(*), sum(f2) FROM t1")
+                self.assertEqual(cursor.fetchone(), [1000, 499500])
+            db.rollback()
+        finally:
+            cursor.close()
+
+    def testCopyFromRows(self):
+        try:
+            cursor = db.cursor()
+            rows = [(1, 1, "tab\tnewline\nbackslash\\"), (2, 2, None)]
+            cursor.copy_from_rows("t1", iter(rows))
+            self.assertEqual(cursor.rowcount, 2)
+            # the text of floats and dates is str on Python 2
+            cursor.copy_from_rows(
+                "t1", [(3, "a|b", 3), (4, 1.5, 4),
+                       (5, datetime.date(2001, 2, 3), 5)],
+                sep="|", null="", columns=("f1", "f3", "f2"))
+            self.assertEqual(cursor.rowcount, 3)
+
+            cursor.execute("SELECT * FROM t1 ORDER BY f1")
+            retval = cursor.fetchall()
+            self.assertEqual(retval, (
+                [1, 1, "tab\tnewline\nbackslash\\"], [2, 2, None],
+                [3, 3, "a|b"], [4, 4, "1.5"], [5, 5, "2001-02-03"]))
+            db.rollback()
+        finally:
+            cursor.close()
+
+    def testCopyToIter(self):
+        try:
+            cursor = db.cursor()
+            cursor.execute(
+                "INSERT INTO t1 (f1, f2, f3) VALUES (%s, %s, %s)", (1, 1, 1))
+            cursor.execute(
+                "INSERT INTO t1 (f1, f2, f3) VALUES (%s, %s, %s)", (2, 2, 2))
+
+            data = cursor.copy_to_iter("COPY t1 TO STDOUT")
+            self.assertEqual(b("").join(data), b("1\t1\t1\n2\t2\t2\n"))
+            self.assertEqual(cursor.rowcount, 2)
+
+            lines = cursor.copy_to_iter(
+                "COPY (SELECT * FROM t1 ORDER BY f1) TO STDOUT", lines=True)
+            self.assertEqual(
+                list(lines), [b("1\t1\t1\n"), b("2\t2\t2\n")])
+
+            # the COPY only starts with the first next(), so iterators that
+            # are closed first or never used don't hold the connection
+            cursor.copy_to_iter("COPY t1 TO STDOUT").close()
+            cursor.copy_to_iter("COPY t1 TO STDOUT")
+            cursor.execute("SELECT count(*) FROM t1")
+            self.assertEqual(cursor.fetchone()[0], 2)
+            db.rollback()
+        finally:
+            cursor.close()
+
+    def testCopyOutRows(self):
+        try:
+            cursor = db.cursor()
+            cursor.copy_rows(
+                "t1", None, ((i, i * 2, str(i)) for i in range(1000)))
+            rows = cursor.copy_out_rows(
+                "SELECT f1, f3, current_date AS d FROM t1 ORDER BY f1")
+            self.assertEqual(next(rows)[:2], [0, '0'])
+            retval = list(rows)
+            self.assertEqual(len(retval), 999)
+            self.assertEqual(retval[-1][:2], [999, '999'])
+            self.assertEqual(cursor.rowcount, 1000)
+
+            # leaving the iterator part way through doesn't break the
+            # connection
+            rows = cursor.copy_out_rows("SELECT * FROM t1")
+            next(rows)
+            rows.close()
+            cursor.execute("SELECT count(*) FROM t1")
+            self.assertEqual(cursor.fetchone()[0], 1000)
+            db.rollback()
+        finally:
+            cursor.close()
+
     def testCopyWithoutTableOrQuery(self):
         try:
             cursor = db.cursor()
@@ -0,0 +1,71 @@
+import unittest
+from pg8000 import dbapi
+from pg8000 import h_pack, i_pack, q_pack, d_pack
+from pg8000.six import b
+from pg8000.util import LRUCache
+
+
+def textout(v):
+    return v.encode("utf8")
+
+
+def double_send(v):
+    return d_pack(v * 2)
+
+
+# Tests of the compile_param_encoder function.
+class Tests(unittest.TestCase):
+    def testNoParams(self):
+        encode = dbapi.compile_param_encoder([])
+        self.assertEqual(encode(()), h_pack(0) + h_pack(0))
+
+    def testFixedWidth(self):
+        params = [
+            (16, 1, dbapi.bool_send), (21, 1, h_pack), (-1, 1, None),
+            (20, 1, q_pack), (701, 1, d_pack)]
+        encode = dbapi.compile_param_encoder(params)
+        self.assertEqual(
+            encode((True, 7, None, 8, 1.5)),
+            h_pack(5) + h_pack(1) * 5 + h_pack(5) +
+            i_pack(1) + b("\x01") + i_pack(2) + h_pack(7) + i_pack(-1) +
+            i_pack(8) + q_pack(8) + i_pack(8) + d_pack(1.5))
+
+    def testMixed(self):
+        params = [(23, 1, i_pack), (705, 1, textout), (23, 1, i_pack)]
+        encode = dbapi.compile_param_encoder(params)
+        self.assertEqual(
+            encode((1, "abc", 2)),
+            h_pack(3) + h_pack(1) * 3 + h_pack(3) +
+            i_pack(4) + i_pack(1) + i_pack(3) + b("abc") +
+            i_pack(4) + i_pack(2))
+
+    def testEncoderCache(self):
+        conn = dbapi.Connection.__new__(dbapi.Connection)
+        conn._init_protocol()
+        params, encode = conn.make_param_encoder((1.5,))
+        self.assertTrue(conn.make_param_encoder((2.5,))[1] is encode)
+        conn.py_types[float] = (701, 1, double_send)
+        params, encode = conn.make_param_encoder((1.5,))
+        self.assertEqual(encode((1.5,))[-8:], d_pack(3.0))
+        for i in range(200):
+            conn.make_param_encoder((1.5,) * i)
+        self.assertEqual(len(conn._param_encoders), 100)
+
+
+# Tests of the cache holding compiled encoders.
+class LRUCacheTests(unittest.TestCase):
+    def testEviction(self):
+        cache = LRUCache(2)
+        cache["a"] = 1
+        cache["b"] = 2
+        self.assertEqual(cache["a"], 1)
+        cache["c"] = 3
+        self.assertFalse("b" in cache)
+        self.assertEqual((cache["a"], cache["c"]), (1, 3))
+        cache["c"] = 4
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache["c"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
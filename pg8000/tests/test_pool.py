@@ -0,0 +1,108 @@
+import unittest
+import os
+import threading
+from pg8000 import pool
+from pg8000.errors import PoolTimeoutError, PoolClosedError, ProgrammingError
+from .connection_settings import db_connect
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.pool = pool.ConnectionPool(db_connect, min_size=1, max_size=2)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def query(self, conn, query):
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query)
+            return cursor.fetchone()[0]
+        finally:
+            cursor.close()
+
+    def testGetPut(self):
+        self.assertEqual((self.pool.size, self.pool.idle), (1, 1))
+        conn1 = self.pool.getconn()
+        conn2 = self.pool.getconn()
+        self.assertEqual((self.pool.size, self.pool.idle), (2, 0))
+        self.pool.putconn(conn2)
+        self.assertTrue(self.pool.getconn() is conn2)
+        self.pool.putconn(conn1)
+        self.pool.putconn(conn2)
+        self.assertRaises(ProgrammingError, self.pool.putconn, conn2)
+        self.assertEqual(self.pool.stats.checkouts, 3)
+
+    def testTimeout(self):
+        conn1 = self.pool.getconn()
+        conn2 = self.pool.getconn()
+        self.assertRaises(PoolTimeoutError, self.pool.getconn, 0.1)
+        self.assertEqual(self.pool.stats.timeouts, 1)
+
+        timer = threading.Timer(0.1, self.pool.putconn, (conn1,))
+        timer.start()
+        self.assertTrue(self.pool.getconn(5) is conn1)
+        timer.join()
+        self.assertEqual(self.pool.stats.waits, 1)
+        self.assertTrue(self.pool.stats.wait_seconds > 0)
+        self.pool.putconn(conn1)
+        self.pool.putconn(conn2)
+
+    def testRollbackOnReturn(self):
+        conn = self.pool.getconn()
+        self.query(conn, "SELECT txid_current()")
+        self.assertTrue(conn.in_transaction)
+        self.pool.putconn(conn)
+        self.assertFalse(conn.in_transaction)
+
+    def testDiscard(self):
+        conn = self.pool.getconn()
+        conn.autocommit = True
+        self.query(conn, "SELECT set_config('application_name', 'x', false)")
+        self.pool.putconn(conn, discard=True)
+        self.assertFalse(conn.autocommit)
+
+        conn = self.pool.getconn()
+        self.assertEqual(
+            self.query(conn, "SELECT current_setting('application_name')"),
+            "")
+        self.pool.putconn(conn)
+
+    def testBrokenConnection(self):
+        conn = self.pool.getconn()
+        conn.close()
+        self.pool.putconn(conn)
+        self.assertEqual(self.pool.size, 0)
+        conn = self.pool.getconn()
+        self.assertEqual(self.query(conn, "SELECT 1"), 1)
+        self.pool.putconn(conn)
+
+    def testClose(self):
+        conn = self.pool.getconn()
+        self.pool.close()
+        self.assertRaises(PoolClosedError, self.pool.getconn)
+        self.pool.putconn(conn)
+        self.assertEqual(self.pool.size, 0)
+
+    if hasattr(os, "fork"):
+        def testFork(self):
+            conn = self.pool.getconn()
+            pid = os.fork()
+            if pid == 0:
+                ok = False
+                try:
+                    child_conn = self.pool.getconn()
+                    ok = child_conn is not conn and self.query(
+                        child_conn, "SELECT 1") == 1
+                    self.pool.putconn(conn)
+                    self.pool.putconn(child_conn)
+                    self.pool.close()
+                finally:
+                    os._exit(0 if ok else 1)
+            self.assertEqual(os.waitpid(pid, 0)[1], 0)
+            self.assertEqual(self.query(conn, "SELECT 1"), 1)
+            self.pool.putconn(conn)
+
+
+if __name__ == "__main__":
+    unittest.main()
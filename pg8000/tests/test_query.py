@@ -1,5 +1,6 @@
 import unittest
 import threading
+import time
 from pg8000 import dbapi
 from .connection_settings import db_connect
 from pg8000.six import u, b
@@ -34,6 +35,136 @@ class Tests(unittest.TestCase):
 
         db.commit()
 
+    # BEGIN is sent after the statement has been parsed as the unnamed
+    # statement, so it mustn't be a simple query, which would destroy it.
+    def testFirstStatement(self):
+        conn = dbapi.connect(**db_connect)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT %s", (1,))
+            self.assertEqual(cursor.fetchall(), ([1],))
+            self.assertTrue(conn.in_transaction)
+            cursor.close()
+        finally:
+            conn.close()
+
+    # SAVEPOINT fails outside a transaction block, so it would fail if a
+    # statement could be sent between a commit and the next BEGIN.
+    def testConcurrentCommit(self):
+        errors = []
+
+        def run():
+            try:
+                cursor = db.cursor()
+                for i in range(100):
+                    cursor.execute("SAVEPOINT s")
+                cursor.close()
+            except Exception:
+                errors.append(exc_info()[1])
+
+        threads = [threading.Thread(target=run) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        while [thread for thread in threads if thread.is_alive()]:
+            db.commit()
+        for thread in threads:
+            thread.join()
+        db.commit()
+        self.assertEqual(errors, [])
+        self.assertFalse(db.in_transaction)
+
+    def testCancel(self):
+        try:
+            cursor = db.cursor()
+            timer = threading.Timer(0.5, db.cancel)
+            timer.start()
+            try:
+                cursor.execute("SELECT pg_sleep(10)")
+                self.fail("expected an error")
+            except dbapi.ProgrammingError:
+                self.assertEqual(exc_info()[1].args[1], b('57014'))
+            timer.join()
+            db.rollback()
+            cursor.execute("SELECT 1")
+            self.assertEqual(cursor.fetchone(), [1])
+        finally:
+            cursor.close()
+        db.rollback()
+
+    def testExecuteTimeout(self):
+        try:
+            cursor = db.cursor()
+            self.assertRaises(
+                dbapi.StatementTimeoutError, cursor.execute,
+                "SELECT pg_sleep(10)", timeout=0.5)
+            db.rollback()
+            cursor.execute("SELECT pg_sleep(0.1)", timeout=10)
+            self.assertRaises(
+                dbapi.StatementTimeoutError, cursor.executemany,
+                "SELECT pg_sleep(0.2)", [()] * 10, deadline=time.time() + 0.5)
+            db.rollback()
+            cursor.execute("SELECT 1")
+            self.assertEqual(cursor.fetchone(), [1])
+        finally:
+            cursor.close()
+        db.rollback()
+
+    # A timeout that runs out while another cursor's statement is running
+    # must not cancel that statement.
+    def testTimeoutWhileWaiting(self):
+        errors = []
+
+        def run():
+            try:
+                cursor = db.cursor()
+                cursor.execute("SELECT pg_sleep(1)")
+                cursor.close()
+            except Exception:
+                errors.append(exc_info()[1])
+
+        try:
+            cursor = db.cursor()
+            thread = threading.Thread(target=run)
+            thread.start()
+            time.sleep(0.2)
+            try:
+                cursor.execute("SELECT 1", timeout=0.2)
+                self.fail("expected an error")
+            except dbapi.StatementTimeoutError:
+                self.assertEqual(exc_info()[1].args[1], None)
+            thread.join()
+            self.assertEqual(errors, [])
+        finally:
+            cursor.close()
+        db.rollback()
+
+    # Each cursor's portal needs several fetches, which are interleaved.
+    def testInterleavedCursors(self):
+        try:
+            cursor1 = db.cursor()
+            cursor2 = db.cursor()
+            cursor1.execute("SELECT generate_series(1, 1000)")
+            cursor2.execute("SELECT generate_series(1001, 2000)")
+            for i in range(1, 1001):
+                self.assertEqual(cursor1.fetchone(), [i])
+                self.assertEqual(cursor2.fetchone(), [i + 1000])
+            self.assertEqual(cursor1.fetchone(), None)
+            self.assertEqual(cursor2.fetchone(), None)
+        finally:
+            cursor1.close()
+            cursor2.close()
+            db.rollback()
+
+    def testAutocommitLargeResult(self):
+        try:
+            db.autocommit = True
+            cursor = db.cursor()
+            cursor.execute("SELECT generate_series(1, 1000)")
+            self.assertEqual(len(cursor.fetchall()), 1000)
+        finally:
+            cursor.close()
+            db.autocommit = False
+
     def testDatabaseError(self):
         try:
             cursor = db.cursor()
@@ -0,0 +1,70 @@
+import unittest
+from pg8000 import pool, routing
+from pg8000.errors import ProgrammingError, ConnectionClosedError
+from .connection_settings import db_connect
+
+
+# The test server isn't in recovery, so it's used as both the primary and a
+# replica that is always up to date.
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.primary = pool.ConnectionPool(db_connect)
+        self.replica = pool.ConnectionPool(db_connect)
+        broken_connect = db_connect.copy()
+        broken_connect["unix_sock"] = "/file-does-not-exist"
+        self.broken = pool.ConnectionPool(broken_connect)
+        self.router = routing.ReplicaRouter(
+            self.primary, [self.broken, self.replica], max_replay_lag=5,
+            read_your_writes=True)
+        self.conn = self.router.connect()
+
+    def tearDown(self):
+        self.conn.close()
+        self.router.close()
+
+    def testRouting(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT 1")
+        self.assertEqual(cursor.fetchone(), [1])
+        self.assertTrue(self.conn._pool is self.primary)
+        self.conn.commit()
+        self.assertTrue(self.conn.connection is None)
+        self.assertTrue(self.conn.last_commit_lsn is not None)
+        self.assertRaises(ProgrammingError, cursor.fetchone)
+
+        self.conn.read_only = True
+        for i in range(3):
+            cursor.execute("SELECT 2")
+            self.assertEqual(cursor.fetchall(), ([2],))
+            self.assertTrue(self.conn._pool is self.replica)
+            self.conn.rollback()
+        self.assertEqual(self.primary.stats.checkouts, 1)
+        self.assertEqual(self.replica.stats.checkouts, 3)
+        self.assertEqual(self.broken.stats.connects, 0)
+        cursor.close()
+
+    def testLeastLoaded(self):
+        router = routing.ReplicaRouter(
+            self.primary, [self.replica, pool.ConnectionPool(db_connect)],
+            balance='least-loaded')
+        conns = [router.connect() for i in range(2)]
+        for conn in conns:
+            conn.read_only = True
+            conn.cursor().execute("SELECT 1")
+        self.assertFalse(conns[0]._pool is conns[1]._pool)
+        for conn in conns:
+            conn.close()
+        router.replicas[1].close()
+
+    def testClose(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT 1")
+        conn = self.conn.connection
+        self.conn.close()
+        self.assertFalse(conn.in_transaction)
+        self.assertRaises(ConnectionClosedError, self.conn.cursor)
+        self.conn = self.router.connect()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,6 +7,11 @@ from .connection_settings import db_connect
 from pg8000.six import b, IS_JYTHON
 import uuid
 
+try:
+    import ipaddress
+except ImportError:
+    ipaddress = None
+
 db = dbapi.connect(**db_connect)
 
 if not IS_JYTHON:
@@ -518,7 +523,102 @@ class Tests(unittest.TestCase):
     def testMacaddr(self):
         self.cursor.execute("SELECT macaddr '08002b:010203'")
         retval = self.cursor.fetchall()
-        self.assertEqual(retval[0][0], "08:00:2b:01:02:03")
+        self.assertEqual(str(retval[0][0]), "08:00:2b:01:02:03")
+
+    def testMacaddrRoundtrip(self):
+        for v in (
+                pg8000_types.Macaddr(b("\x08\x00\x2b\x01\x02\x03")),
+                pg8000_types.Macaddr(b("\x08\x00\x2b\x01\x02\x03\x04\x05"))):
+            self.cursor.execute("SELECT %s as f1", (v,))
+            retval = self.cursor.fetchall()
+            self.assertEqual(retval[0][0], v)
+
+    def testInetRoundtrip(self):
+        if ipaddress is None:
+            self.skipTest("ipaddress isn't available")
+        for v in (
+                ipaddress.ip_address('192.168.0.1'),
+                ipaddress.ip_interface('192.168.0.1/24'),
+                ipaddress.ip_address('2001:db8::1'),
+                ipaddress.ip_interface('2001:db8::1/64')):
+            self.cursor.execute("SELECT %s as f1", (v,))
+            retval = self.cursor.fetchall()
+            self.assertEqual(retval[0][0], v)
+
+    def testCidrRoundtrip(self):
+        if ipaddress is None:
+            self.skipTest("ipaddress isn't available")
+        v = ipaddress.ip_network('192.168.0.0/16')
+        self.cursor.execute("SELECT %s as f1", (v,))
+        retval = self.cursor.fetchall()
+        self.assertEqual(retval[0][0], v)
+        column_name, column_typeoid = self.cursor.description[0][0:2]
+        self.assertEqual(column_typeoid, 650, "type should be CIDR")
+
+    def testRangeRoundtrip(self):
+        # int and date ranges are canonicalized to [) by the server
+        for v in (
+                pg8000_types.Range(1, 10),
+                pg8000_types.Range(None, 7000000000),
+                pg8000_types.Range(decimal.Decimal("1.5"), None, "[]"),
+                pg8000_types.Range(
+                    datetime.datetime(2001, 2, 3, 4, 5, 6),
+                    datetime.datetime(2001, 2, 3, 5, 5, 6), "(]"),
+                pg8000_types.Range(
+                    datetime.date(2001, 2, 3), datetime.date(2001, 3, 3))):
+            self.cursor.execute("SELECT %s as f1", (v,))
+            retval = self.cursor.fetchall()
+            self.assertEqual(retval[0][0], v)
+
+    def testRangeOut(self):
+        self.cursor.execute(
+            "SELECT 'empty'::int4range, '(1,5]'::int8range, "
+            "'[2001-02-03 04:05:06+00,)'::tstzrange, "
+            "ARRAY['[1,2)'::int4range, '[3,4)'::int4range]")
+        retval = self.cursor.fetchone()
+        self.assertEqual(
+            retval, [
+                pg8000_types.Range(is_empty=True),
+                pg8000_types.Range(2, 6),
+                pg8000_types.Range(datetime.datetime(
+                    2001, 2, 3, 4, 5, 6, tzinfo=pg8000_types.utc)),
+                [pg8000_types.Range(1, 2), pg8000_types.Range(3, 4)]])
+
+    def testInetAsInt(self):
+        if ipaddress is None:
+            self.skipTest("ipaddress isn't available")
+        try:
+            db.inet_as_int = True
+            self.cursor.execute(
+                "SELECT '10.1.2.3'::inet, '10.1.0.0/16'::cidr")
+            retval = self.cursor.fetchone()
+            self.assertEqual(retval, [(0x0a010203, 32), (0x0a010000, 16)])
+        finally:
+            db.inet_as_int = False
+
+    def testJsonRoundtrip(self):
+        val = {'name': 'Apollo 11 Cave', 'zebra': True, 'age': 26.003}
+        self.cursor.execute("SELECT %s as f1", (val,))
+        retval = self.cursor.fetchall()
+        self.assertEqual(retval[0][0], val)
+
+    def testJsonbOut(self):
+        self.cursor.execute(
+            "SELECT '{\"a\": [1, 2.5, null], \"b\": \"x\"}'::jsonb, "
+            "'[1, {\"c\": false}]'::json")
+        retval = self.cursor.fetchone()
+        self.assertEqual(
+            retval, [{'a': [1, 2.5, None], 'b': 'x'}, [1, {'c': False}]])
+
+    def testJsonRaw(self):
+        loads = db.json_loads
+        try:
+            db.json_loads = None
+            self.cursor.execute("SELECT '{\"a\": 1}'::jsonb")
+            retval = self.cursor.fetchall()
+            self.assertEqual(retval[0][0], b('{"a": 1}'))
+        finally:
+            db.json_loads = loads
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,5 +1,8 @@
 import unittest
-from pg8000.pg8000_types import Interval
+import datetime
+from pg8000.pg8000_types import (
+    Interval, Macaddr, Range, interval_unchecked)
+from pg8000.six import b
 
 
 # Type conversion tests
@@ -44,5 +47,57 @@ class Tests(unittest.TestCase):
         self.intervalRangeTest(
             "microseconds", in_range_microseconds, out_of_range_microseconds)
 
+    def testIntervalSlots(self):
+        i = Interval(microseconds=1, days=2, months=3)
+        self.assertRaises(AttributeError, setattr, i, "years", 1)
+
+    def testIntervalUnchecked(self):
+        self.assertEqual(
+            interval_unchecked(1, 2, 3),
+            Interval(microseconds=1, days=2, months=3))
+
+    def testIntervalTimedelta(self):
+        td = datetime.timedelta(days=-3, hours=5, microseconds=7)
+        i = Interval.from_timedelta(td)
+        self.assertEqual(
+            i, Interval(microseconds=5 * 3600 * 1000000 + 7, days=-3))
+        self.assertEqual(i.to_timedelta(), td)
+        self.assertRaises(ValueError, Interval(months=1).to_timedelta)
+
+    def testIntervalRelativedelta(self):
+        try:
+            from dateutil.relativedelta import relativedelta
+        except ImportError:
+            self.skipTest("dateutil isn't installed")
+        rd = relativedelta(years=1, months=2, days=3, hours=4, seconds=5)
+        i = Interval.from_relativedelta(rd)
+        self.assertEqual(
+            i, Interval(microseconds=(4 * 3600 + 5) * 1000000, days=3,
+                        months=14))
+        self.assertEqual(i.to_relativedelta(), rd)
+
+    def testRangeBounds(self):
+        r = Range(1, 5, "(]")
+        self.assertEqual(r.bounds, "(]")
+        self.assertEqual((r.lower_inc, r.upper_inc), (False, True))
+        r = Range(None, 5, "[]")
+        self.assertEqual(r.bounds, "(]")
+        self.assertTrue(r.lower_inf)
+        self.assertFalse(r.upper_inf)
+        r = Range(is_empty=True)
+        self.assertTrue(r.is_empty)
+        self.assertEqual(r.bounds, None)
+        self.assertRaises(ValueError, Range, 1, 2, "[[")
+
+    def testRangeEquality(self):
+        self.assertEqual(Range(1, 2), Range(1, 2, "[)"))
+        self.assertNotEqual(Range(1, 2), Range(1, 2, "[]"))
+        self.assertEqual(hash(Range(1, 2)), hash(Range(1, 2)))
+
+    def testMacaddrStr(self):
+        self.assertEqual(
+            str(Macaddr(b("\x08\x00\x2b\x01\x02\x03"))),
+            "08:00:2b:01:02:03")
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,3 +1,4 @@
+from itertools import count
 
 
 class MulticastDelegate(object):
@@ -18,3 +19,34 @@ class MulticastDelegate(object):
     def __call__(self, *args, **kwargs):
         for d in self.delegates:
             d(*args, **kwargs)
+
+
+# A mapping that holds at most maxsize items, discarding the least recently
+# used item to make room for a new one.  Finding that item takes a scan, but
+# that only happens when an item is added to a full cache.
+class LRUCache(object):
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = {}
+        self._ticks = count()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __getitem__(self, key):
+        item = self._items[key]
+        item[1] = next(self._ticks)
+        return item[0]
+
+    def __setitem__(self, key, value):
+        items = self._items
+        if key not in items and len(items) >= self.maxsize:
+            # list() takes a copy in one step, so other threads can't change
+            # the dict during the scan
+            oldest = min(list(items.items()), key=lambda item: item[1][1])
+            # another thread may have discarded it already
+            items.pop(oldest[0], None)
+        items[key] = [value, next(self._ticks)]